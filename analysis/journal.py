@@ -0,0 +1,76 @@
+"""
+Append-only journal of finished sweep cases.
+
+Every finished case is written as one JSON line and fsynced as soon as its
+metrics are parsed, so a crashed or interrupted sweep keeps all completed
+work. A line cut short by a crash is dropped when the journal is opened.
+
+    journal = ResultJournal("analysis/metrics.jsonl")
+    todo = [c for c in cases if c["case"] not in journal.completed()]
+    ...                                   # journal.append(row) per case
+    df = journal.consolidate("analysis/metrics.csv")
+
+When a case appears more than once (rerun without --resume into the same
+journal), the last row wins.
+"""
+import json
+import os
+from pathlib import Path
+
+import pandas as pd
+
+from analysis.result_cache import json_default
+
+
+class ResultJournal:
+    """JSONL file of metric rows, one line per finished case."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._repair()
+
+    def _repair(self):
+        # Drop a partial last line left by a crash in the middle of append()
+        if not self.path.exists():
+            return
+        with open(self.path, "r+b") as f:
+            data = f.read()
+            if data and not data.endswith(b"\n"):
+                f.truncate(data.rfind(b"\n") + 1)
+
+    def reset(self):
+        """Start an empty journal."""
+        open(self.path, "w").close()
+
+    def append(self, row):
+        """Write one row and force it to disk."""
+        line = json.dumps(row, default=json_default) + "\n"
+        with open(self.path, "a") as f:
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def rows(self):
+        """All journaled rows in completion order."""
+        if not self.path.exists():
+            return []
+        with open(self.path) as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def completed(self):
+        """Case ids with a journaled row."""
+        return {row["case"] for row in self.rows()}
+
+    def consolidate(self, metrics_path=None):
+        """Metrics table with one row per case (last one wins), optionally written as CSV."""
+        df = pd.DataFrame(self.rows())
+        if not df.empty:
+            df = df.drop_duplicates("case", keep="last").reset_index(drop=True)
+        if metrics_path is not None:
+            metrics_path = Path(metrics_path)
+            metrics_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = metrics_path.with_name(metrics_path.name + ".tmp")
+            df.to_csv(tmp, index=False)
+            os.replace(tmp, metrics_path)
+        return df
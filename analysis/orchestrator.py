@@ -0,0 +1,127 @@
+"""
+Asynchronous orchestration of external solver runs.
+
+Orchestrator runs solver commands (DualSPHysics/Chrono-style binaries, or
+pythonkoodit/dummy_sim.py as a stand-in) as asyncio subprocesses:
+
+    - at most `concurrency` solvers run at the same time (default: cores)
+    - every attempt has a wall-clock timeout; a timed out solver is killed
+    - failed or timed out attempts are retried `retries` times with
+      exponential backoff
+    - stdout and stderr are streamed line by line into the per-run log, so a
+      running case can be followed with tail -f
+    - parse(out_dir) runs in a thread pool as soon as a solver finishes, after
+      its concurrency slot is released, so parsing overlaps with the solvers
+      that are still running
+
+A job is a dict with keys case, command (argument list), out_dir and
+optionally log (default out_dir/solver.log) and params (copied to the row).
+on_result(row, info) is called for every finished case as it completes,
+on_failure(error) for every CaseFailed. Any error of a case (a solver that
+cannot be started, a failing parse or callback) becomes a CaseFailed of that
+case, so it never aborts the other cases; start errors are retried like
+failed runs.
+"""
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from analysis.parameter_sweep import default_workers
+
+
+class CaseFailed(Exception):
+    """A case failed: the solver after all retries, or parsing its output."""
+
+    def __init__(self, case, message):
+        super().__init__(f"{case}: {message}")
+        self.case = case
+
+
+async def run_command(cmd, log_path, timeout=None):
+    """Run cmd, stream its output to log_path and return the exit code; kill it on timeout."""
+    proc = await asyncio.create_subprocess_exec(*[str(c) for c in cmd], stdout=asyncio.subprocess.PIPE,
+                                                stderr=asyncio.subprocess.STDOUT)
+    with open(log_path, "ab") as log:
+        async def pump():
+            async for line in proc.stdout:
+                log.write(line)
+                log.flush()
+
+        try:
+            await asyncio.wait_for(asyncio.gather(pump(), proc.wait()), timeout)
+        except asyncio.TimeoutError:
+            proc.kill()
+            await proc.wait()
+            raise
+    return proc.returncode
+
+
+class Orchestrator:
+    """Concurrency-limited solver runs with timeouts, retries and pipelined parsing."""
+
+    def __init__(self, concurrency=None, timeout=None, retries=0, backoff=1.0, parse_workers=None):
+        self.concurrency = concurrency or default_workers()
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.parse_workers = parse_workers or self.concurrency
+
+    async def _solve(self, job, slots):
+        log_path = Path(job.get("log") or Path(job["out_dir"]) / "solver.log")
+        log_path.parent.mkdir(parents=True, exist_ok=True)
+        Path(job["out_dir"]).mkdir(parents=True, exist_ok=True)
+        for attempt in range(self.retries + 1):
+            if attempt:
+                await asyncio.sleep(self.backoff * 2**(attempt - 1))
+            with open(log_path, "ab") as log:
+                log.write(f"=== {job['case']} attempt {attempt + 1} ===\n".encode())
+            async with slots:
+                try:
+                    code = await run_command(job["command"], log_path, self.timeout)
+                    error = f"exit code {code}" if code else None
+                except asyncio.TimeoutError:
+                    error = f"timed out after {self.timeout} s"
+                except Exception as e:   # e.g. missing solver binary or permissions
+                    error = f"could not run solver: {e!r}"
+            if error is None:
+                return attempt + 1
+            with open(log_path, "ab") as log:
+                log.write(f"=== {error} ===\n".encode())
+        raise CaseFailed(job["case"], f"{error} (attempts: {self.retries + 1}, log: {log_path})")
+
+    async def _case(self, job, parse, slots, pool, on_result):
+        t0 = time.perf_counter()
+        attempts = await self._solve(job, slots)
+        try:
+            metrics = await asyncio.get_running_loop().run_in_executor(pool, parse, Path(job["out_dir"]))
+        except Exception as e:
+            raise CaseFailed(job["case"], f"parsing failed: {e}") from e
+        try:
+            row = dict(case=job["case"], **job.get("params", {}), **metrics)
+            if on_result is not None:
+                on_result(row, dict(attempts=attempts, elapsed=time.perf_counter() - t0))
+        except Exception as e:
+            raise CaseFailed(job["case"], f"{e!r}") from e
+        return row
+
+    async def run_async(self, jobs, parse, on_result=None, on_failure=None):
+        """Run all jobs; returns the metric rows in completion order."""
+        slots = asyncio.Semaphore(self.concurrency)
+        rows = []
+        with ThreadPoolExecutor(max_workers=self.parse_workers) as pool:
+            tasks = [asyncio.ensure_future(self._case(job, parse, slots, pool, on_result)) for job in jobs]
+            for task in asyncio.as_completed(tasks):
+                try:
+                    rows.append(await task)
+                except CaseFailed as e:
+                    if on_failure is not None:
+                        on_failure(e)
+                    else:
+                        print("Simulation failed:", e)
+        return rows
+
+    def run(self, jobs, parse, on_result=None, on_failure=None):
+        """Blocking wrapper of run_async."""
+        return asyncio.run(self.run_async(jobs, parse, on_result, on_failure))
+
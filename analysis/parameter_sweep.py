@@ -1,13 +1,208 @@
 """
 Automated parameter sweep for SPH-DEM simulation.
+
+A sweep is a list of cases, each a dict with a case id, the varied
+parameters and the fully resolved config:
+
+    cases = expand_grid(base_cfg, {"dem.n_particles": [0, 30, 60],
+                                   "fluid.mu": [4.45e-4, 8.9e-4]})
+
+Grid keys are dotted paths into base_config.yaml. run_sweep() runs
+run_case(case) for every case on a process pool with one worker per
+available core. The workers are spawned with the BLAS/OpenMP thread count
+set to 1, so N workers use N cores instead of fighting over them. Metric rows
+are appended to the CSV table as soon as each case finishes, so the table
+fills in completion order and a long sweep can be inspected while running.
+With a ResultJournal (analysis.journal) the rows are also fsynced to a JSONL
+journal, so an interrupted sweep can be resumed.
+run_command_case() can reuse finished runs from a content-addressed
+ResultCache (analysis.result_cache), so only changed cases are recomputed.
+
+Usage:
+    python analysis/parameter_sweep.py dem.n_particles=0,30,60 fluid.mu=4.45e-4,8.9e-4
 """
-import numpy as np
+import itertools
+import json
+import multiprocessing
+import os
 import subprocess
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import yaml
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+from analysis.result_cache import ResultCache, cache_key, file_version  # noqa: E402
+from sph.domain import THREAD_ENV  # noqa: E402
+
+
+def default_workers():
+    """Number of cores available to this process."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def set_by_path(cfg, path, value):
+    """Set cfg["a"]["b"]["c"] = value for path "a.b.c"."""
+    *parents, key = path.split(".")
+    for name in parents:
+        cfg = cfg.setdefault(name, {})
+    cfg[key] = value
+
+
+def apply_overrides(base, overrides):
+    """Deep copy of base with the dotted-path overrides applied."""
+    cfg = json.loads(json.dumps(base))
+    for path, value in overrides.items():
+        set_by_path(cfg, path, value)
+    return cfg
+
+
+def case_id_from(params):
+    """Readable case id from the varied parameters, e.g. n_particles0_mu0.00089."""
+    return "_".join(f"{path.split('.')[-1]}{value}" for path, value in params.items())
+
+
+def expand_grid(base, grid, keep=None, case_id=case_id_from):
+    """Full factorial of grid (dotted path -> list of values), optionally filtered by keep(params)."""
+    paths = list(grid)
+    cases = []
+    for values in itertools.product(*(grid[p] for p in paths)):
+        params = dict(zip(paths, values))
+        if keep is not None and not keep(params):
+            continue
+        cases.append(dict(case=case_id(params), params=params, config=apply_overrides(base, params)))
+    return cases
+
+
+def _init_worker():
+    for name in THREAD_ENV:
+        os.environ[name] = "1"
+
+
+def append_row(path, row):
+    """Append one metrics row to a CSV table (header on the first row)."""
+    path = Path(path)
+    pd.DataFrame([row]).to_csv(path, mode="a", index=False, header=not path.exists())
+
+
+def run_sweep(cases, run_case, workers=None, metrics_path=None, journal=None):
+    """Run run_case(case) -> metrics dict for every case on a process pool.
+
+    run_case must be a module-level function (it is pickled to the workers).
+    Rows are appended to metrics_path and to journal (analysis.journal) as
+    the cases complete; failed cases are reported and skipped. Returns the
+    metrics table as a DataFrame.
+    """
+    workers = min(workers or default_workers(), max(len(cases), 1))
+    if metrics_path is not None:
+        metrics_path = Path(metrics_path)
+        metrics_path.parent.mkdir(parents=True, exist_ok=True)
+        if metrics_path.exists():
+            metrics_path.unlink()
+    # Spawned workers start a fresh interpreter, so the thread limits apply before numpy is imported
+    saved = {name: os.environ.get(name) for name in THREAD_ENV}
+    _init_worker()
+    rows = []
+    try:
+        ctx = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=_init_worker) as pool:
+            futures = {pool.submit(run_case, case): case["case"] for case in cases}
+            for future in as_completed(futures):
+                cid = futures[future]
+                try:
+                    row = future.result()
+                except Exception as e:
+                    print("Simulation failed:", cid, e)
+                    continue
+                rows.append(row)
+                if journal is not None:
+                    journal.append(row)
+                if metrics_path is not None:
+                    append_row(metrics_path, row)
+                print("Done:", cid, {k: round(v, 3) for k, v in row.items() if isinstance(v, (int, float))})
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+    return pd.DataFrame(rows)
+
+
+def run_command_case(case, command, runs_dir, parse, cache=None, solver_version="", seed=0):
+    """Write the case config, run command (with {config} and {out} placeholders) and parse(out_dir).
+
+    With a ResultCache (analysis.result_cache), a run with the same resolved
+    config, solver version and seed is restored instead of rerun, and its
+    parsed metrics are reused.
+    """
+    out_dir = Path(runs_dir) / case["case"]
+    key = cache_key(case["config"], solver_version, seed) if cache is not None else None
+    if key is None or cache.restore_run(key, out_dir) is None:
+        out_dir.mkdir(parents=True, exist_ok=True)
+        cfg_path = out_dir / "config.yaml"
+        with open(cfg_path, "w") as f:
+            yaml.safe_dump(case["config"], f)
+        cmd = [part.format(config=cfg_path, out=out_dir) for part in command]
+        subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL)
+        if key is not None:
+            cache.store_run(key, out_dir)
+    metrics = cache.get_metrics(key) if key is not None else None
+    if metrics is None:
+        metrics = parse(out_dir)
+        if key is not None:
+            cache.put_metrics(key, metrics)
+    return dict(case=case["case"], **case["params"], **metrics)
+
+
+def final_velocity(out_dir):
+    """Minimal metric: last value and RMS of velocity_uniform.txt."""
+    dat = np.loadtxt(Path(out_dir) / "velocity_uniform.txt", delimiter=",", skiprows=1)
+    return dict(v_end=float(dat[-1, 1]), v_rms=float(np.sqrt(np.mean(dat[:, 1]**2))))
+
+
+def _dummy_case(case):
+    solver = ROOT / "pythonkoodit" / "dummy_sim.py"
+    command = [sys.executable, str(solver), "{config}", "{out}"]
+    return run_command_case(case, command, ROOT / "runs" / "sweep", final_velocity,
+                            ResultCache(ROOT / "runs" / ".cache"), file_version(solver))
+
+
+def sweep_parameters(grid, base_config=ROOT / "base_config.yaml", workers=None,
+                     metrics_path=ROOT / "analysis" / "sweep_metrics.csv"):
+    """Sweep grid over base_config.yaml with the dummy simulator as the solver."""
+    with open(base_config) as f:
+        base = yaml.safe_load(f)
+    return run_sweep(expand_grid(base, grid), _dummy_case, workers, metrics_path)
+
+
+def _scalar(text):
+    value = yaml.safe_load(text)
+    # PyYAML reads values like 1e-3 (no decimal point) as strings
+    if isinstance(value, str):
+        try:
+            return float(value)
+        except ValueError:
+            pass
+    return value
+
 
-# Placeholder: define parameter ranges and run batch simulations
+def parse_grid(args):
+    """Command-line grid "path=v1,v2,..." -> {path: [values]} (values parsed as YAML scalars)."""
+    grid = {}
+    for arg in args:
+        path, values = arg.split("=", 1)
+        grid[path] = [_scalar(v) for v in values.split(",")]
+    return grid
 
-def sweep_parameters():
-    print("Parameter sweep: implement batch simulation logic here.")
 
 if __name__ == "__main__":
-    sweep_parameters()
+    grid = parse_grid(sys.argv[1:]) or {"dem.n_particles": [0, 30, 60]}
+    print(sweep_parameters(grid))
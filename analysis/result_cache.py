@@ -0,0 +1,133 @@
+"""
+Content-addressed cache for sweep case results.
+
+A case is keyed by the SHA-256 of the fully resolved config (canonical
+JSON, sorted keys), the solver version and the seed, so a case id or a
+file name never decides whether a result is reused -- only the inputs do.
+Each entry is a directory
+
+    <cache>/<key[:2]>/<key>/run/          copy of the solver output directory
+    <cache>/<key[:2]>/<key>/metrics.json  parse_results() output
+
+Entries are written to a temporary directory and renamed into place, so
+concurrent sweep workers never see half-written entries. Every hit touches
+the entry; when the cache grows beyond max_bytes the least recently used
+entries are removed.
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+
+def cache_key(config, solver_version="", seed=0):
+    """Hex SHA-256 of the resolved config, solver version and seed."""
+    payload = json.dumps({"config": config, "solver": str(solver_version), "seed": seed},
+                         sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def file_version(path):
+    """Solver version from the contents of its script or binary."""
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()[:16]
+
+
+def json_default(obj):
+    """json.dump default for metrics and journal rows: NumPy scalars as Python numbers."""
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError(f"not JSON serializable: {type(obj)}")
+
+
+class ResultCache:
+    """Finished runs and their metrics on disk, with size-based LRU eviction."""
+
+    def __init__(self, root, max_bytes=2 * 1024**3):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def _entry(self, key):
+        return self.root / key[:2] / key
+
+    def _touch(self, entry):
+        try:
+            os.utime(entry)
+        except FileNotFoundError:
+            pass
+
+    def restore_run(self, key, out_dir):
+        """Copy a cached run to out_dir; returns out_dir, or None on a miss."""
+        run = self._entry(key) / "run"
+        if not run.is_dir():
+            return None
+        self._touch(self._entry(key))
+        out_dir = Path(out_dir)
+        if out_dir.exists():
+            shutil.rmtree(out_dir)
+        shutil.copytree(run, out_dir)
+        return out_dir
+
+    def store_run(self, key, out_dir):
+        """Store a finished run directory under key."""
+        self._store(key, "run", lambda target: shutil.copytree(out_dir, target))
+
+    def get_metrics(self, key):
+        """Cached parse_results() output, or None."""
+        path = self._entry(key) / "metrics.json"
+        if not path.is_file():
+            return None
+        self._touch(self._entry(key))
+        with open(path) as f:
+            return json.load(f)
+
+    def put_metrics(self, key, metrics):
+        def write(target):
+            with open(target, "w") as f:
+                json.dump(metrics, f, default=json_default)
+        self._store(key, "metrics.json", write)
+
+    def _store(self, key, name, write):
+        entry = self._entry(key)
+        entry.mkdir(parents=True, exist_ok=True)
+        tmp = Path(tempfile.mkdtemp(dir=entry, prefix=".tmp-"))
+        try:
+            write(tmp / name)
+            try:
+                os.rename(tmp / name, entry / name)
+            except OSError:
+                pass  # another worker stored the same result first
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+        self._touch(entry)
+        self.evict(keep=entry)
+
+    def size(self):
+        return sum(f.stat().st_size for f in self.root.rglob("*") if f.is_file())
+
+    def evict(self, keep=None):
+        """Remove least recently used entries until the cache fits in max_bytes.
+
+        The entry keep (the one just stored) is never removed, even if it
+        alone is larger than max_bytes; it goes on a later eviction.
+        """
+        entries = []
+        for entry in self.root.glob("*/*"):
+            try:
+                size = sum(f.stat().st_size for f in entry.rglob("*") if f.is_file())
+                entries.append((entry.stat().st_mtime, size, entry))
+            except FileNotFoundError:
+                continue
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if entry == keep:
+                continue
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
@@ -0,0 +1,173 @@
+"""
+Memoized verification studies: convergence orders and Richardson extrapolation.
+
+A study is a set of one-parameter sweeps around a default point. Sweeps
+often share points (the default N in the dt sweep is the same run as the
+default dt in the N sweep), so every requested point is resolved against
+the defaults, deduplicated and run only once; the unique points are run in
+parallel with run_sweep (analysis.parameter_sweep), and the results are
+memoized for the lifetime of the study.
+
+    study = VerificationStudy(run_point, dict(N=200, dt=1e-3, mu=0.1))
+    study.add("N", [50, 100, 200, 400])
+    study.add("dt", [4e-3, 2e-3, 1e-3, 5e-4])
+    study.run()
+    table = study.convergence("N", "final_height", spacing=lambda N: 1.0 / N)
+
+run_point(**point) must be a module-level function (it is pickled to the
+workers) returning a dict of metrics. Nothing here plots.
+
+For three solutions f3, f2, f1 on grids h3 > h2 > h1 with ratios
+r32 = h3 / h2 and r21 = h2 / h1, the observed order p solves
+
+    p = |ln|(f3 - f2) / (f2 - f1)| + ln((r21^p - s) / (r32^p - s))| / ln r21,
+    s = sign((f3 - f2) / (f2 - f1)),
+
+which reduces to p = ln|(f3 - f2) / (f2 - f1)| / ln r for a constant ratio,
+and the Richardson extrapolated value is f1 + (f1 - f2) / (r21^p - 1).
+"""
+import functools
+
+import numpy as np
+import pandas as pd
+
+from analysis.parameter_sweep import case_id_from, run_sweep
+
+
+def observed_order(f_coarse, f_medium, f_fine, r21, r32=None, iterations=50):
+    """Observed order of convergence from three solutions (NaN if undefined)."""
+    r32 = r21 if r32 is None else r32
+    e32, e21 = f_coarse - f_medium, f_medium - f_fine
+    if e21 == 0 or e32 == 0:
+        return np.nan
+    ratio = e32 / e21
+    s = np.sign(ratio)
+    p = np.log(abs(ratio)) / np.log(r21)
+    if np.isclose(r21, r32):
+        return float(abs(p))
+    # Fixed-point iteration for non-constant refinement ratios
+    for _ in range(iterations):
+        q = np.log((r21**p - s) / (r32**p - s))
+        p_new = abs(np.log(abs(ratio)) + q) / np.log(r21)
+        if not np.isfinite(p_new) or abs(p_new - p) < 1e-12:
+            break
+        p = p_new
+    return float(p_new) if np.isfinite(p_new) else np.nan
+
+
+def richardson_extrapolate(f_fine, f_coarse, ratio, order):
+    """Richardson extrapolated value from two solutions with grid ratio h_coarse / h_fine."""
+    if not np.isfinite(order) or order <= 0:
+        return np.nan
+    return f_fine + (f_fine - f_coarse) / (ratio**order - 1.0)
+
+
+def error_order(spacing, errors):
+    """Least-squares slope of log(error) against log(spacing) (error ~ spacing^p)."""
+    spacing, errors = np.asarray(spacing, dtype=float), np.asarray(errors, dtype=float)
+    ok = (spacing > 0) & (errors > 0)
+    if ok.sum() < 2:
+        return np.nan
+    return float(np.polyfit(np.log(spacing[ok]), np.log(errors[ok]), 1)[0])
+
+
+def point_key(point):
+    """Hashable, order-independent key of a parameter point."""
+    return tuple(sorted(point.items()))
+
+
+def _run_case(run_point, case):
+    return dict(case=case["case"], **run_point(**case["params"]))
+
+
+class VerificationStudy:
+    """One-parameter sweeps around default parameters, with deduplicated, memoized runs."""
+
+    def __init__(self, run_point, defaults, workers=None):
+        self.run_point = run_point
+        self.defaults = dict(defaults)
+        self.workers = workers
+        self.sweeps = {}
+        self._memo = {}
+        self.runs = 0
+
+    def point(self, **overrides):
+        """Default point with overrides applied."""
+        return {**self.defaults, **overrides}
+
+    def add(self, param, values, name=None, **fixed):
+        """Register a sweep of param over values (other parameters: defaults and fixed)."""
+        name = name or param
+        self.sweeps[name] = (param, [self.point(**fixed, **{param: v}) for v in values])
+        return name
+
+    def pending(self):
+        """Unique registered points that have not been run yet."""
+        points = {}
+        for _, sweep in self.sweeps.values():
+            for point in sweep:
+                key = point_key(point)
+                if key not in self._memo:
+                    points.setdefault(key, point)
+        return list(points.values())
+
+    def run(self):
+        """Run every pending point once, in parallel; returns the number of new runs."""
+        points = self.pending()
+        if not points:
+            return 0
+        cases = {case_id_from(point): point for point in points}
+        rows = run_sweep([dict(case=cid, params=point, config=point) for cid, point in cases.items()],
+                         functools.partial(_run_case, self.run_point), self.workers).to_dict("records")
+        for row in rows:
+            self._memo[point_key(cases[row.pop("case")])] = row
+        self.runs += len(rows)
+        return len(rows)
+
+    def result(self, **overrides):
+        """Metrics of one point, run on demand."""
+        point = self.point(**overrides)
+        key = point_key(point)
+        if key not in self._memo:
+            self._memo[key] = self.run_point(**point)
+            self.runs += 1
+        return self._memo[key]
+
+    def sweep(self, name):
+        """(value, metrics) pairs of a registered sweep, in the order given."""
+        param, points = self.sweeps[name]
+        if any(point_key(p) not in self._memo for p in points):
+            self.run()
+        failed = [p for p in points if point_key(p) not in self._memo]
+        if failed:
+            raise RuntimeError(f"sweep {name}: runs failed at {failed}")
+        return [(p[param], self._memo[point_key(p)]) for p in points]
+
+    def convergence(self, name, metric, exact=None, spacing=None):
+        """Convergence table of one metric along a sweep, coarsest grid first.
+
+        spacing(value) maps the swept value to a grid spacing (default: the
+        value itself, as for dt; use e.g. lambda N: L / N for a particle
+        count). Columns: value, spacing, <metric>, order and extrapolated
+        (from the last three points, Richardson), and with an exact value
+        also error and error_order (from the last two points).
+        """
+        spacing = spacing or (lambda value: value)
+        rows = sorted(((spacing(v), v, float(res[metric])) for v, res in self.sweep(name)), reverse=True)
+        table = pd.DataFrame(rows, columns=["spacing", "value", metric])[["value", "spacing", metric]]
+        h, f = table["spacing"].to_numpy(), table[metric].to_numpy()
+        order = np.full(len(f), np.nan)
+        extrapolated = np.full(len(f), np.nan)
+        for i in range(2, len(f)):
+            order[i] = observed_order(f[i - 2], f[i - 1], f[i], h[i - 1] / h[i], h[i - 2] / h[i - 1])
+            extrapolated[i] = richardson_extrapolate(f[i], f[i - 1], h[i - 1] / h[i], order[i])
+        table["order"] = order
+        table["extrapolated"] = extrapolated
+        if exact is not None:
+            error = np.abs(f - exact)
+            table["error"] = error
+            pair_order = np.full(len(f), np.nan)
+            for i in range(1, len(f)):
+                pair_order[i] = error_order(h[i - 1:i + 1], error[i - 1:i + 1])
+            table["error_order"] = pair_order
+        return table
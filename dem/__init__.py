@@ -1,2 +1,10 @@
-# DEM particle simulation module
-# Implement DEM particle class, contact models, and integration routines here.
+"""
+DEM building blocks for the granular damper.
+
+Modules:
+    - models: linear spring-dashpot and Hertz-Mindlin contact laws (normal
+      and tangential)
+    - history: sorted int64-keyed per-contact state (friction springs)
+    - engine: grid broad-phase, vectorized narrow-phase, box wall contacts
+      and Coulomb friction
+"""
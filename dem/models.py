@@ -0,0 +1,155 @@
+"""
+Normal contact force laws for DEM grains (disks in 2D).
+
+Every model evaluates whole arrays of contacts at once:
+
+    f = model.normal_force(overlap, vn, r_eff, m_eff)
+
+overlap = r_i + r_j - |x_j - x_i| > 0, vn = (v_j - v_i) . n with n the unit
+vector from i to j (negative while the grains approach), r_eff and m_eff the
+reduced radius r_i r_j / (r_i + r_j) and mass m_i m_j / (m_i + m_j). The
+result is the magnitude of the repulsive force, clipped at zero so that the
+dashpot never pulls grains together; grain i gets -f n and grain j +f n. A
+wall is a contact partner with infinite radius and mass (r_eff = r_i,
+m_eff = m_i).
+
+    - LinearSpringDashpot: f = k_n overlap - c_n vn, with c_n chosen for the
+      coefficient of restitution e: c_n = 2 zeta sqrt(m_eff k_n),
+      zeta = -ln e / sqrt(pi^2 + ln^2 e)
+    - HertzMindlin: f = 4/3 E* sqrt(r_eff) overlap^(3/2) - c_n vn with
+      S_n = 2 E* sqrt(r_eff overlap), c_n = -2 sqrt(5/6) beta sqrt(S_n m_eff),
+      beta = ln e / sqrt(ln^2 e + pi^2) and E* = E / (2 (1 - nu^2)) for two
+      grains of the same material (E / (1 - nu^2) against a rigid wall)
+
+With friction_static > 0 the models also give the tangential (Mindlin)
+spring and dashpot of a contact, used with the per-contact spring
+displacement of dem.history and the Coulomb limit mu F_n in dem.engine:
+
+    - LinearSpringDashpot: k_t (default 2/7 k_n), c_t = 2 zeta sqrt(m_eff k_t)
+    - HertzMindlin: k_t = 8 G* sqrt(r_eff overlap), c_t = -2 sqrt(5/6) beta
+      sqrt(k_t m_eff), G* = G / (2 (2 - nu)) between grains (G / (2 - nu)
+      against a rigid wall), G = E / (2 (1 + nu))
+
+A contact sticks while the trial tangential force stays below
+friction_static F_n and then slides with friction_dynamic F_n (default:
+the static coefficient).
+
+The damping coefficients give e exactly for an unclipped force; with the
+clipping the grains separate slightly before the overlap closes, so the
+effective restitution is a little higher (about 0.47 for e = 0.4, linear).
+The 2D grains use the sphere (Hertz) law, as quasi-2D DEM codes do.
+contact_model_from_config() builds the model named in the dem section of
+base_config.yaml.
+"""
+import numpy as np
+
+
+def _damping_ratio(restitution):
+    """zeta of a linear dashpot giving the coefficient of restitution e (0 < e <= 1)."""
+    if not 0.0 < restitution <= 1.0:
+        raise ValueError(f"restitution must be in (0, 1]: {restitution}")
+    log_e = np.log(restitution)
+    return -log_e / np.sqrt(np.pi**2 + log_e**2)
+
+
+def _friction(static, dynamic):
+    static = float(static)
+    dynamic = static if dynamic is None else float(dynamic)
+    if static < 0 or dynamic < 0 or dynamic > static:
+        raise ValueError(f"need 0 <= friction_dynamic <= friction_static: {dynamic}, {static}")
+    return static, dynamic
+
+
+class LinearSpringDashpot:
+    """Linear spring k_n with a viscous dashpot tuned to the coefficient of restitution."""
+
+    name = 'linear'
+
+    def __init__(self, k_n, restitution=0.5, friction_static=0.0, friction_dynamic=None, k_t=None):
+        self.k_n = float(k_n)
+        self.restitution = float(restitution)
+        self.zeta = _damping_ratio(restitution)
+        self.friction_static, self.friction_dynamic = _friction(friction_static, friction_dynamic)
+        self.k_t = 2.0 / 7.0 * self.k_n if k_t is None else float(k_t)
+
+    def normal_force(self, overlap, vn, r_eff, m_eff, wall=False):
+        c_n = 2.0 * self.zeta * np.sqrt(m_eff * self.k_n)
+        return np.maximum(self.k_n * overlap - c_n * vn, 0.0)
+
+    def stiffness(self, overlap, r_eff, wall=False):
+        """Tangent normal stiffness dF/d(overlap) (for stable time steps)."""
+        return np.full_like(np.asarray(overlap, dtype=float), self.k_n)
+
+    def tangential_stiffness(self, overlap, r_eff, wall=False):
+        return np.full_like(np.asarray(overlap, dtype=float), self.k_t)
+
+    def tangential_damping(self, k_t, m_eff):
+        return 2.0 * self.zeta * np.sqrt(m_eff * k_t)
+
+
+class HertzMindlin:
+    """Hertz normal contact with the Tsuji/Mindlin viscoelastic damping."""
+
+    name = 'hertz_mindlin'
+
+    def __init__(self, youngs_modulus, poisson=0.3, restitution=0.5, friction_static=0.0, friction_dynamic=None):
+        self.youngs_modulus = float(youngs_modulus)
+        self.poisson = float(poisson)
+        self.restitution = float(restitution)
+        self.friction_static, self.friction_dynamic = _friction(friction_static, friction_dynamic)
+        _damping_ratio(restitution)
+        log_e = np.log(restitution)
+        self.beta = log_e / np.sqrt(log_e**2 + np.pi**2)
+
+    def effective_modulus(self, wall=False):
+        """E* of a grain-grain (same material) or grain-rigid wall contact."""
+        e = self.youngs_modulus / (1.0 - self.poisson**2)
+        return e if wall else 0.5 * e
+
+    def normal_force(self, overlap, vn, r_eff, m_eff, wall=False):
+        e_eff = self.effective_modulus(wall)
+        overlap = np.maximum(overlap, 0.0)
+        s_n = 2.0 * e_eff * np.sqrt(r_eff * overlap)
+        c_n = -2.0 * np.sqrt(5.0 / 6.0) * self.beta * np.sqrt(s_n * m_eff)
+        return np.maximum(4.0 / 3.0 * e_eff * np.sqrt(r_eff) * overlap**1.5 - c_n * vn, 0.0)
+
+    def stiffness(self, overlap, r_eff, wall=False):
+        """Tangent normal stiffness dF/d(overlap) = 2 E* sqrt(r_eff overlap)."""
+        return 2.0 * self.effective_modulus(wall) * np.sqrt(r_eff * np.maximum(overlap, 0.0))
+
+    def tangential_stiffness(self, overlap, r_eff, wall=False):
+        """Mindlin tangential stiffness 8 G* sqrt(r_eff overlap)."""
+        g = self.youngs_modulus / (2.0 * (1.0 + self.poisson)) / (2.0 - self.poisson)
+        g_eff = g if wall else 0.5 * g
+        return 8.0 * g_eff * np.sqrt(r_eff * np.maximum(overlap, 0.0))
+
+    def tangential_damping(self, k_t, m_eff):
+        return -2.0 * np.sqrt(5.0 / 6.0) * self.beta * np.sqrt(k_t * m_eff)
+
+
+MODELS = {cls.name: cls for cls in (LinearSpringDashpot, HertzMindlin)}
+
+
+def contact_model_from_config(cfg, k_n=None):
+    """Contact model of the dem section of base_config.yaml.
+
+    contact_model 'Hertz-Mindlin' uses youngs_modulus, poisson and
+    restitution_coeff; 'linear' (or 'spring-dashpot') needs the spring
+    stiffness, from dem.stiffness or the k_n argument. Both take the
+    friction from friction_coeff_static and friction_coeff_dynamic.
+    """
+    dem = cfg.get('dem', {})
+    name = str(dem.get('contact_model', 'linear')).lower().replace('-', '_').replace(' ', '_')
+    restitution = float(dem.get('restitution_coeff', 0.5))
+    friction = dict(friction_static=float(dem.get('friction_coeff_static', 0.0)),
+                    friction_dynamic=dem.get('friction_coeff_dynamic'))
+    if friction['friction_dynamic'] is not None:
+        friction['friction_dynamic'] = float(friction['friction_dynamic'])
+    if name == 'hertz_mindlin':
+        return HertzMindlin(float(dem['youngs_modulus']), float(dem.get('poisson', 0.3)), restitution, **friction)
+    if name in ('linear', 'spring_dashpot', 'linear_spring_dashpot'):
+        k_n = dem.get('stiffness', k_n)
+        if k_n is None:
+            raise ValueError("linear contact model needs dem.stiffness")
+        return LinearSpringDashpot(float(k_n), restitution, **friction)
+    raise ValueError(f"Unknown contact_model: {dem.get('contact_model')}")
@@ -1,6 +1,11 @@
 
 import numpy as np
 
+from sph.kernels import get_kernel
+from sph.neighbors import make_neighbor_search
+from sph.operators import density, pair_geometry, pressure_acceleration
+from sph.particles import PHASE_FLUID, ParticleSet
+
 # --- Parameters ---
 dx = 0.02  # Particle spacing
 h = 2 * dx  # Kernel radius
@@ -9,99 +14,58 @@ c0 = 20.0  # Artificial speed of sound
 g = np.array([0, -9.81])  # Gravity
 dt = 0.0005  # Time step
 n_steps = 1000  # Number of time steps
+nx, ny = 10, 10  # Fluid block size (particles)
 
-# --- SPH particle class (fluid) ---
-class SPHParticle:
-    def __init__(self, x, v, m):
-        self.x = np.array(x, dtype=float)  # Position
-        self.v = np.array(v, dtype=float)  # Velocity
-        self.m = m  # Mass
-        self.rho = rho0  # Density
-        self.p = 0.0  # Pressure
-        self.f = np.zeros(2)  # Total force
-
-# --- DEM particle class (solid disk) ---
-class DEMParticle:
-    def __init__(self, X, V, R, M):
-        self.X = np.array(X, dtype=float)  # Position
-        self.V = np.array(V, dtype=float)  # Velocity
-        self.R = R  # Radius
-        self.M = M  # Mass
-        self.F = np.zeros(2)  # Total force
+# --- Cubic spline kernel (normalization precomputed once for this h) ---
+kernel = get_kernel('cubic', 2, h)
 
-# --- Cubic spline kernel function ---
-def W(r, h):
-    q = np.linalg.norm(r) / h
-    sigma = 10 / (7 * np.pi * h**2)
-    if q < 1:
-        return sigma * (1 - 1.5*q**2 + 0.75*q**3)
-    elif q < 2:
-        return sigma * 0.25 * (2 - q)**3
-    else:
-        return 0.0
-
-# --- Gradient of cubic spline kernel ---
-def gradW(r, h):
-    q = np.linalg.norm(r) / h
-    sigma = 10 / (7 * np.pi * h**2)
-    if q == 0:
-        return np.zeros_like(r)
-    if q < 1:
-        return sigma * (-3*q + 2.25*q**2) * r / (h**2 * q)
-    elif q < 2:
-        return -sigma * 0.75 * (2 - q)**2 * r / (h**2 * q)
-    else:
-        return np.zeros_like(r)
+# --- Particle store: fluid (and solids, tagged PHASE_DEM) as contiguous arrays ---
+particles = ParticleSet(nx * ny)
 
 # --- Initialize fluid particles (left half of tank) ---
-fluid_particles = []
-for i in range(10):
-    for j in range(10):
-        fluid_particles.append(SPHParticle([0.1 + i*dx, 0.1 + j*dx], [0, 0], m=dx*dx*rho0))
+I, J = np.meshgrid(np.arange(nx), np.arange(ny), indexing='ij')
+particles.add(np.stack([0.1 + I.ravel()*dx, 0.1 + J.ravel()*dx], axis=1), m=dx*dx*rho0, rho=rho0,
+              phase=PHASE_FLUID)
 
 print("Starting 2D SPH dam break simulation...")
 
+# --- Neighbour search backend (kernel support 2h), chosen by a timing probe ---
+search = make_neighbor_search('auto', 2 * h, pos=particles.x)
+print(f"Neighbour search backend: {search.name}")
+
 # --- Main time integration loop ---
+n = len(particles)
 for step in range(n_steps):
-    # 1) Neighbor search (brute force, small N)
-    for pi in fluid_particles:
-        pi.rho = 0.0
-        for pj in fluid_particles:
-            pi.rho += pj.m * W(pi.x - pj.x, h)
-    # 2) Equation of state (pressure)
-    for pi in fluid_particles:
-        pi.p = c0**2 * (pi.rho - rho0)
+    # 1) Neighbor search: pairs (i, j) closer than 2h, self pairs included
+    i, j = search.pairs(particles.x)
+    rij, r = pair_geometry(particles.x, i, j)  # rij = x_j - x_i
+    # 2) Density and equation of state (pressure)
+    particles.rho = density(i, kernel.w(r), particles.m[j], n)
+    particles.p = c0**2 * (particles.rho - rho0)
     # 3) Fluid forces (pressure, gravity)
-    for pi in fluid_particles:
-        f = np.zeros(2)
-        for pj in fluid_particles:
-            if pi is pj: continue
-            r = pi.x - pj.x
-            f -= pj.m * (pi.p/pi.rho**2 + pj.p/pj.rho**2) * gradW(r, h)
-        f += pi.m * g
-        pi.f = f
+    gradw = kernel.grad(rij, r)
+    particles.f = particles.m[:, None] * g - pressure_acceleration(i, j, gradw, particles.p, particles.rho,
+                                                                   particles.m[j], n)
     # 4) Update positions and velocities (Euler)
-    for pi in fluid_particles:
-        pi.v += dt * pi.f / pi.m
-        pi.x += dt * pi.v
-        # Simple wall at y=0
-        if pi.x[1] < 0:
-            pi.x[1] = 0
-            pi.v[1] *= -0.5
+    particles.v += dt * particles.f / particles.m[:, None]
+    particles.x += dt * particles.v
+    # Simple wall at y=0
+    below = particles.x[:, 1] < 0
+    particles.x[below, 1] = 0
+    particles.v[below, 1] *= -0.5
     # Print progress every 100 steps
     if step % 100 == 0:
-        y_fluid = np.mean([p.x[1] for p in fluid_particles])
+        y_fluid = np.mean(particles.x[:, 1])
         print(f"Step {step:4d}: mean fluid y = {y_fluid:.3f}")
 
 # --- Visualisointi: piirretään lopputilanne ---
 import matplotlib.pyplot as plt
-fluid_x = [p.x[0] for p in fluid_particles]
-fluid_y = [p.x[1] for p in fluid_particles]
+fluid = particles.select(PHASE_FLUID)
 plt.figure(figsize=(6,3))
-plt.scatter(fluid_x, fluid_y, s=20, c='b', label='Fluid')
+plt.scatter(particles.x[fluid, 0], particles.x[fluid, 1], s=20, c='b', label='Fluid')
 plt.xlabel('x')
 plt.ylabel('y')
 plt.title('SPH dam-break: fluid particles at final step')
 plt.legend()
 plt.tight_layout()
-plt.show()
\ No newline at end of file
+plt.show()
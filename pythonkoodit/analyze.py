@@ -1,41 +1,45 @@
 # sweep.py
-import os, json, yaml, itertools, subprocess, time
+import os, sys, yaml, subprocess, time, argparse
 import numpy as np
 import pandas as pd
 from pathlib import Path
 
-# --- 1) parametrit ---
-N_PARTICLES = [0, 30, 60]
-D_MM        = [6, 8, 10]               # mm
-MU_SCALE    = [0.5, 1.0, 2.0]           # x 8.9e-4 Pa s
-HFILL_SCALE = [0.75, 1.0, 1.25]         # x 19.7 mm
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from analysis.journal import ResultJournal  # noqa: E402
+from analysis.orchestrator import Orchestrator  # noqa: E402
+from analysis.parameter_sweep import expand_grid, run_sweep  # noqa: E402
+from analysis.result_cache import ResultCache, cache_key, file_version  # noqa: E402
 
-BASE = yaml.safe_load(open("base_config.yaml"))
-
-# --- 2) apufunktiot ---
-def case_id(n, dmm, mus, hfs):
-    return f"np{n}_d{dmm}mm_mu{mus}x_h{hfs}x"
+# --- 1) parametrit: base_config.yaml-polku -> arvot (keskimmäinen = perusarvo) ---
+MU0, HFILL0 = 8.9e-4, 19.7e-3
+GRID = {
+    "dem.n_particles":     [0, 30, 60],
+    "dem.particle_size_m": [0.006, 0.008, 0.010],                               # 6, 8, 10 mm
+    "fluid.mu":            [round(s * MU0, 12) for s in (0.5, 1.0, 2.0)],       # x 8.9e-4 Pa s
+    "tank.fill_height_m":  [round(s * HFILL0, 12) for s in (0.75, 1.0, 1.25)],  # x 19.7 mm
+}
+# vinkki: pidä h/Δx samana -> Δx = h/1.3; älä muuta h, ellei pakko
+# jos muutat d, skaalaa paino ja inertiakertoimet vastaavasti
 
-def make_config(n, dmm, mus, hfs):
-    cfg = json.loads(json.dumps(BASE))  # deep copy
-    cfg["dem"]["n_particles"] = int(n)
-    cfg["dem"]["particle_size_m"] = dmm * 1e-3
-    cfg["fluid"]["mu"] = mus * 8.9e-4
-    cfg["tank"]["fill_height_m"] = hfs * 19.7e-3
-
-    # skaalaa DEM-partikkelimassa ja tarvittaessa SPH-resoluutio
-    # vinkki: pidä h/Δx samana -> Δx = h/1.3; älä muuta h, ellei pakko
-    # jos muutat d, skaalaa paino ja inertiakertoimet vastaavasti
+BASE = yaml.safe_load(open("base_config.yaml"))
 
-    return cfg
+# Valmiit ajot ja niiden metriikat: avain = hash(config, ratkaisijan versio, siemen)
+CACHE = ResultCache(".sweep_cache", max_bytes=2 * 1024**3)
+SOLVER = Path(__file__).with_name("dummy_sim.py")
+SEED = 0
+TIMEOUT = 3600.0   # [s] seinäkelloraja yhdelle ajolle
+RETRIES = 1
 
-def run_sim(config_path, out_dir):
-    out_dir.mkdir(parents=True, exist_ok=True)
+# --- 2) apufunktiot ---
+def sim_command(config_path, out_dir):
     # Korvaa alla oleva komento omallasi (DualSPHysics, Chrono, tms.)
     # Esim:
     # cmd = ["DualSPHysics", "-in", str(config_path), "-out", str(out_dir)]
-    cmd = ["python", "dummy_sim.py", str(config_path), str(out_dir)]  # placeholder
-    subprocess.run(cmd, check=True)
+    return [sys.executable, str(SOLVER), str(config_path), str(out_dir)]  # placeholder
+
+def run_sim(config_path, out_dir):
+    out_dir.mkdir(parents=True, exist_ok=True)
+    subprocess.run(sim_command(config_path, out_dir), check=True)
 
 def parse_results(out_dir):
     # Oleta CSV "time, velocity". Tee samat analyysit kuin liitteessäsi
@@ -65,38 +69,96 @@ def parse_results(out_dir):
     return dict(f=f, f_std=f_std, delta=delta, delta_ci=delta_ci,
                 E_diss_cycle=Ediss_cycle, t_end=t[-1])
 
-def main():
-    configs_dir = Path("sweeps/configs")
-    runs_dir    = Path("runs")
-    results = []
-    for n, dmm, mus, hfs in itertools.product(N_PARTICLES, D_MM, MU_SCALE, HFILL_SCALE):
-        # tee halutessasi vain OAT: vaihda itertools.product -> listatavien yhdistelmien läpikäynti
-        # tai lisää suodatin:
-        if sum([dmm!=8, mus!=1.0, hfs!=1.0]) > 0 and n not in (0,60):
-            # esimerkkinä: pidä “täysfaktoriaali” vain n=0 ja n=60, muuten OAT
-            continue
+def write_config(case):
+    cfg_path = Path("sweeps/configs") / f"{case['case']}.yaml"
+    cfg_path.parent.mkdir(parents=True, exist_ok=True)
+    yaml.safe_dump(case["config"], open(cfg_path, "w"))
+    return cfg_path
+
+def parse_cached(key, out_dir):
+    """parse_results välimuistin kautta."""
+    metrics = CACHE.get_metrics(key)
+    if metrics is None:
+        metrics = parse_results(out_dir)
+        CACHE.put_metrics(key, metrics)
+    return metrics
 
-        cid = case_id(n, dmm, mus, hfs)
-        cfg = make_config(n, dmm, mus, hfs)
-        cfg_path = configs_dir / f"{cid}.yaml"
-        cfg_path.parent.mkdir(parents=True, exist_ok=True)
-        yaml.safe_dump(cfg, open(cfg_path, "w"))
-
-        out_dir = runs_dir / cid
-        try:
-            run_sim(cfg_path, out_dir)
-        except subprocess.CalledProcessError as e:
-            print("Simulation failed:", cid, e)
+def run_case(case):
+    """Yksi ajo prosessipoolissa: config -> simulaatio -> metriikat."""
+    cid = case["case"]
+    cfg_path = write_config(case)
+    out_dir = Path("runs") / cid
+    # Ajetaan vain muuttuneet tapaukset; muut palautetaan välimuistista
+    key = cache_key(case["config"], file_version(SOLVER), SEED)
+    if CACHE.restore_run(key, out_dir) is None:
+        run_sim(cfg_path, out_dir)
+        CACHE.store_run(key, out_dir)
+    return dict(case=cid, **case["params"], **parse_cached(key, out_dir))
+
+def run_async(cases, journal, concurrency=None):
+    """Ajot asyncio-orkestroijalla: rinnakkaisuusraja, aikakatkaisu, uusinnat ja lokit runs/<case>/solver.log.
+
+    Valmiin ajon parse_results tehdään heti, kun ratkaisija päättyy, muiden ajojen vielä käydessä.
+    """
+    version = file_version(SOLVER)
+    rows, jobs = [], []
+    for case in cases:
+        out_dir = Path("runs") / case["case"]
+        key = cache_key(case["config"], version, SEED)
+        metrics = CACHE.get_metrics(key)
+        if metrics is not None and CACHE.restore_run(key, out_dir) is not None:
+            row = dict(case=case["case"], **case["params"], **metrics)
+            rows.append(row)
+            journal.append(row)
             continue
+        jobs.append(dict(case=case["case"], params=case["params"], out_dir=out_dir, key=key,
+                         command=sim_command(write_config(case), out_dir)))
 
-        metrics = parse_results(out_dir)
-        row = dict(case=cid, n_p=n, d_mm=dmm, mu_scale=mus, hfill_scale=hfs, **metrics)
-        results.append(row)
-        print("Done:", cid, {k:round(v,3) for k,v in metrics.items() if isinstance(v,(int,float))})
+    def on_result(row, info):
+        journal.append(row)
+        print("Done:", row["case"], f"({info['attempts']} attempt(s), {info['elapsed']:.1f} s)")
 
-    df = pd.DataFrame(results)
-    df.to_csv("analysis/metrics.csv", index=False)
-    print("Saved -> analysis/metrics.csv")
+    keys = {job["out_dir"].name: job["key"] for job in jobs}
+
+    def parse(out_dir):
+        CACHE.store_run(keys[out_dir.name], out_dir)
+        return parse_cached(keys[out_dir.name], out_dir)
+
+    orchestrator = Orchestrator(concurrency=concurrency, timeout=TIMEOUT, retries=RETRIES)
+    rows += orchestrator.run(jobs, parse, on_result)
+    return pd.DataFrame(rows)
+
+def full_or_default(params):
+    """Täysfaktoriaali vain n=0 ja n=60, muilla n vain perusarvot (vaihda suodatin tarpeen mukaan)."""
+    return params["dem.n_particles"] in (0, 60) or all(
+        value == GRID[path][1] for path, value in params.items() if path != "dem.n_particles")
+
+def make_cases():
+    """Tapaukset base_config.yaml:n ohituksina (analysis.parameter_sweep.expand_grid); tunnisteet kuten sweepissä."""
+    return expand_grid(BASE, GRID, keep=full_or_default)
+
+def main():
+    parser = argparse.ArgumentParser(description="SPH-DEM parameter sweep")
+    parser.add_argument("--pool", action="store_true", help="run cases on a process pool instead of asyncio")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="concurrent runs (default: cores)")
+    parser.add_argument("--resume", action="store_true", help="skip cases already in the journal")
+    args = parser.parse_args()
+    # Jokainen valmis ajo kirjataan heti journaaliin; metrics.csv kootaan siitä lopuksi
+    journal = ResultJournal("analysis/metrics.jsonl")
+    metrics_path = Path("analysis/metrics.csv")
+    cases = make_cases()
+    if args.resume:
+        done = journal.completed()
+        cases = [c for c in cases if c["case"] not in done]
+        print(f"Resuming: {len(done)} cases done, {len(cases)} to run")
+    else:
+        journal.reset()
+    if args.pool:
+        run_sweep(cases, run_case, workers=args.jobs, journal=journal)
+    else:
+        run_async(cases, journal, args.jobs)
+    df = journal.consolidate(metrics_path)
+    print(f"Saved {len(df)} cases -> {metrics_path}")
 
 if __name__ == "__main__":
     main()
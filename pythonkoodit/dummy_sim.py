@@ -45,6 +45,7 @@ np.savetxt(
     np.column_stack([t, v]),
     header="time[s], velocity[m/s]",
     fmt="%.6e",
+    delimiter=",",
 )
 
 print(f"[dummy_sim] Wrote synthetic velocity data to {output_dir}")
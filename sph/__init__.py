@@ -0,0 +1,16 @@
+"""
+SPH building blocks shared by sph_2d_example.py and demo.py.
+
+Modules:
+    - neighbors: neighbour search backends (brute force, cell lists, cKDTree)
+    - kernels: cubic spline and Wendland C2/C4 kernels, optional q^2 lookup tables
+    - operators: pair-list density, pressure and viscous sums (np.bincount)
+    - particles: ParticleSet structure-of-arrays particle store
+    - numba_engine: optional compiled kernels (engine='numba')
+    - timestep: CFL/viscous/force/DEM adaptive time step controller
+    - integrators: Euler, leapfrog, velocity Verlet and predictor-corrector steps
+    - telemetry: preallocated per-step history columns with decimation and disk spill
+    - checkpoint: atomic binary checkpoints of the solver state for restarts
+    - snapshots: chunked, compressed particle field output with random-access reader
+    - domain: shared-memory strip decomposition of the fluid pass over worker processes
+"""
@@ -0,0 +1,259 @@
+"""
+Shared-memory strip decomposition of the SPH fluid pass.
+
+StripDecomposition splits the fluid into vertical strips [x_k, x_k+1) and
+runs the density and force passes of each strip in its own worker process:
+
+    - the buffers of the fluid ParticleSet are moved once into
+      multiprocessing.shared_memory (ParticleSet.reallocate), so the workers
+      read positions and velocities and write rho, p and the accelerations
+      in place; per step only the strip edges go through the pipes
+    - a worker owns the particles of its strip and reads its halo, the
+      particles within 2h of the strip edges. The halo exchange is the
+      barrier between the two passes: every worker writes the density and
+      pressure of its own particles, and the force pass then reads those of
+      the halo from the shared arrays
+    - strip edges are x quantiles of the particles. They are recomputed when
+      the fullest strip holds more than (1 + imbalance) times the mean
+      count, e.g. when the free surface sloshes sideways
+
+Each worker builds the pair list of its owned and halo particles. The local
+indices keep the global order, so the sums are accumulated in the same
+order as in the serial pass, and the results are bit-identical to
+engine='numpy' with pair_mode='full'.
+
+The workers are spawned with the BLAS/OpenMP thread count set to 1, one
+worker per core. Pickling (checkpoints) drops the workers and the shared
+memory; they are recreated on the next call.
+"""
+import multiprocessing
+import os
+import weakref
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+from sph.kernels import get_kernel
+from sph.neighbors import make_neighbor_search
+from sph.operators import density, pair_geometry, pressure_acceleration, viscous_acceleration
+
+# Thread pools of numpy/scipy backends; set before the worker imports numpy
+THREAD_ENV = ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS", "NUMEXPR_NUM_THREADS",
+              "VECLIB_MAXIMUM_THREADS", "NUMBA_NUM_THREADS")
+
+
+class SharedArrays:
+    """Allocator of NumPy arrays in named shared-memory blocks."""
+
+    def __init__(self):
+        self._blocks = {}
+
+    def zeros(self, shape, dtype):
+        """Zero-filled array in a new shared-memory block."""
+        dtype = np.dtype(dtype)
+        shm = SharedMemory(create=True, size=max(int(np.prod(shape)) * dtype.itemsize, 1))
+        arr = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+        arr[...] = 0
+        self._blocks[arr.ctypes.data] = (shm, shape, dtype.str)
+        return arr
+
+    def owns(self, arr):
+        return arr.ctypes.data in self._blocks
+
+    def retain(self, arrays):
+        """Unlink every block that does not back one of arrays (e.g. replaced by a larger one)."""
+        live = {arr.ctypes.data for arr in arrays}
+        for key in [key for key in self._blocks if key not in live]:
+            _release(self._blocks.pop(key)[0])
+
+    def describe(self, arr):
+        """(block name, shape, dtype) of an array from zeros(), for attach()."""
+        shm, shape, dtype = self._blocks[arr.ctypes.data]
+        return shm.name, shape, dtype
+
+    def close(self):
+        """Unlink every block; the memory is freed once no array uses it any more."""
+        for shm, _, _ in self._blocks.values():
+            _release(shm)
+        self._blocks = {}
+
+
+def _release(shm, unlink=True):
+    if unlink:
+        shm.unlink()
+    try:
+        shm.close()
+    except BufferError:
+        pass  # still mapped by a live array
+
+
+def attach(desc, blocks):
+    """Array described by SharedArrays.describe(); blocks caches the opened segments."""
+    name, shape, dtype = desc
+    if name not in blocks:
+        blocks[name] = SharedMemory(name=name)
+    return np.ndarray(shape, dtype=dtype, buffer=blocks[name].buf)
+
+
+def _worker(conn, params):
+    """Worker loop: ('density' | 'forces', arrays, n, lo, hi) -> owned count; None stops.
+
+    'forces' reuses the pairs of the 'density' message just before it and
+    must come with the same arrays, n and strip; otherwise the worker replies
+    with a RuntimeError instead of a count.
+    """
+    h, m = params['h'], params['m']
+    kernel = get_kernel(params['kernel'], 2, h, params['kernel_table_size'])
+    search = make_neighbor_search('hash', 2 * h)
+    blocks = {}
+    density_msg = None
+    while True:
+        msg = conn.recv()
+        if msg is None:
+            break
+        cmd, arrays, n, lo, hi = msg
+        x, v, rho, p = (attach(arrays[name], blocks)[:n] for name in ('x', 'v', 'rho', 'p'))
+        # Vapautetaan korvattujen lohkojen kuvaukset
+        names = {desc[0] for desc in arrays.values()}
+        for name in [name for name in blocks if name not in names]:
+            _release(blocks.pop(name), unlink=False)
+        if cmd == 'forces' and density_msg != (arrays, n, lo, hi):
+            density_msg = None
+            conn.send(RuntimeError("'forces' without a matching 'density' pass"))
+            continue
+        if cmd == 'density':
+            density_msg = (arrays, n, lo, hi)
+            # Omat partikkelit ja 2h-levyinen halo kaistan reunoilla
+            local = np.nonzero((x[:, 0] >= lo - 2 * h) & (x[:, 0] < hi + 2 * h))[0]
+            xl = x[local]
+            own = (xl[:, 0] >= lo) & (xl[:, 0] < hi)
+            i, j = search.pairs(xl)
+            keep = own[i]
+            i, j = i[keep], j[keep]
+            rij, r = pair_geometry(xl, i, j)
+            w = kernel.w(r)
+            gradw = kernel.grad(rij, r)
+            owned = local[own]
+            rho[owned] = density(i, w, m, len(local))[own]
+            p[owned] = params['k'] * (rho[owned] - params['rho0'])
+            conn.send(len(owned))
+        else:
+            nl = len(local)
+            acc = pressure_acceleration(i, j, gradw, p[local], rho[local], m, nl)
+            acc += viscous_acceleration(i, j, w, v[local], rho[local], m, params['mu'], nl)
+            attach(arrays['acc'], blocks)[owned] = acc[own]
+            density_msg = None
+            conn.send(len(owned))
+    for shm in blocks.values():
+        _release(shm, unlink=False)   # arrays of the last step may still be alive; released at exit
+
+
+def _shutdown(workers, shared):
+    for conn, proc in workers:
+        try:
+            conn.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+        proc.join(timeout=5)
+        if proc.is_alive():
+            proc.terminate()
+    shared.close()
+
+
+class StripDecomposition:
+    """Density and SPH forces of a ParticleSet in strips, one worker process per strip."""
+
+    def __init__(self, workers, h, m, k, rho0, mu, kernel='cubic', kernel_table_size=0, imbalance=0.1):
+        if workers < 1:
+            raise ValueError(f"workers must be >= 1: {workers}")
+        self.n_workers = int(workers)
+        self.params = dict(h=h, m=m, k=k, rho0=rho0, mu=mu, kernel=kernel, kernel_table_size=kernel_table_size)
+        self.imbalance = imbalance
+        self.edges = None
+        self.rebalances = 0
+        self._reset()
+
+    def _reset(self):
+        self.shared = SharedArrays()
+        self._acc = None
+        self._workers = []
+        self._finalizer = None
+
+    def _start(self):
+        ctx = multiprocessing.get_context("spawn")
+        # Spawned workers start a fresh interpreter, so the thread limits apply before numpy is imported
+        saved = {name: os.environ.get(name) for name in THREAD_ENV}
+        os.environ.update(dict.fromkeys(THREAD_ENV, "1"))
+        try:
+            for _ in range(self.n_workers):
+                parent, child = ctx.Pipe()
+                proc = ctx.Process(target=_worker, args=(child, self.params), daemon=True)
+                proc.start()
+                child.close()
+                self._workers.append((parent, proc))
+        finally:
+            for name, value in saved.items():
+                if value is None:
+                    os.environ.pop(name, None)
+                else:
+                    os.environ[name] = value
+        self._finalizer = weakref.finalize(self, _shutdown, self._workers, self.shared)
+
+    def share(self, particles):
+        """Move the particle buffers into shared memory (once; again after reallocation)."""
+        if not self.shared.owns(particles.buffers()['x']):
+            particles.reallocate(self.shared.zeros)
+
+    def balance(self, x):
+        """Strip edges (n_workers + 1 values, outer ones infinite); rebalanced on particle counts."""
+        if self.edges is not None:
+            counts = np.bincount(np.searchsorted(self.edges[1:-1], x, side='right'), minlength=self.n_workers)
+            if counts.max() <= (1.0 + self.imbalance) * len(x) / self.n_workers:
+                return self.edges
+        inner = np.quantile(x, np.arange(1, self.n_workers) / self.n_workers) if len(x) else np.zeros(0)
+        self.edges = np.concatenate(([-np.inf], inner, [np.inf]))
+        self.rebalances += 1
+        return self.edges
+
+    def forces(self, particles):
+        """Fill particles.rho and particles.p; returns the SPH accelerations (float64, without gravity)."""
+        self.share(particles)
+        if not self._workers:
+            self._start()
+        n = len(particles)
+        buffers = particles.buffers()
+        if self._acc is None or self._acc.shape[0] < n:
+            self._acc = self.shared.zeros((particles.capacity, 2), np.float64)
+        # Kasvatuksessa korvatut lohkot (vanha _acc, ParticleSetin vanhat puskurit) vapautetaan heti
+        self.shared.retain(list(buffers.values()) + [self._acc])
+        arrays = {name: self.shared.describe(buffers[name]) for name in ('x', 'v', 'rho', 'p')}
+        arrays['acc'] = self.shared.describe(self._acc)
+        edges = self.balance(particles.x[:, 0])
+        for cmd in ('density', 'forces'):
+            for w, (conn, _) in enumerate(self._workers):
+                conn.send((cmd, arrays, n, edges[w], edges[w + 1]))
+            # Estevaihe: kaikki kaistat valmiita ennen seuraavaa vaihetta (halon tiheys ja paine)
+            replies = [conn.recv() for conn, _ in self._workers]
+            for reply in replies:
+                if isinstance(reply, Exception):
+                    raise reply
+        return self._acc[:n].copy()
+
+    def close(self, particles=None):
+        """Stop the workers and release the shared memory, moving particles back to private buffers."""
+        if particles is not None and self.shared.owns(particles.buffers()['x']):
+            particles.reallocate(None)
+        if self._finalizer is not None:
+            self._finalizer()
+        else:
+            self.shared.close()
+        self._reset()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.update(shared=None, _acc=None, _workers=[], _finalizer=None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.shared = SharedArrays()
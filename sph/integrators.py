@@ -0,0 +1,72 @@
+"""
+Time integrators for the coupled SPH-DEM system.
+
+    - 'euler': symplectic (semi-implicit) Euler, v += a dt, x += v dt; first order
+    - 'leapfrog': kick-drift-kick, second order and symplectic for position-
+      dependent forces (velocity-dependent ones see the half-step velocity)
+    - 'verlet': velocity Verlet; as leapfrog, but velocity-dependent forces
+      (viscosity, dashpots) see the predicted end-of-step velocity v + a dt
+    - 'predictor_corrector': Monaghan's midpoint predictor-corrector, second
+      order, two force evaluations per step
+
+step() works on any system object with the methods
+
+    acceleration()   accelerations in the current state (any object)
+    kick(acc, dt)    v += acc dt
+    drift(dt)        x += v dt, then the boundary constraints
+    save()/restore(state)   copy of the state (predictor-corrector only)
+    after_drift(dt)  optional: called once per step after the full drift and
+                     before the end-of-step forces, for sub-cycled parts of
+                     the system (e.g. DEM grains)
+
+Leapfrog and Verlet need one force evaluation per step: the acceleration at
+the end of a step is returned and passed back as acc to the next step.
+"""
+
+INTEGRATORS = ('euler', 'leapfrog', 'verlet', 'predictor_corrector')
+
+
+def _after_drift(system, dt):
+    hook = getattr(system, 'after_drift', None)
+    if hook is not None:
+        hook(dt)
+
+
+def step(scheme, system, dt, acc=None):
+    """Advance system by dt. Returns the end-of-step acceleration, or None if it is not known."""
+    if scheme not in INTEGRATORS:
+        raise ValueError(f"Unknown integrator: {scheme}")
+    if acc is None or scheme in ('euler', 'predictor_corrector'):
+        acc = system.acceleration()
+    if scheme == 'euler':
+        system.kick(acc, dt)
+        system.drift(dt)
+        _after_drift(system, dt)
+        return None
+    if scheme == 'predictor_corrector':
+        # predictor: half step to t + dt/2; corrector: full step with the midpoint acceleration
+        state = system.save()
+        system.drift(0.5 * dt)
+        system.kick(acc, 0.5 * dt)
+        acc_half = system.acceleration()
+        system.restore(state)
+        system.kick(acc_half, 0.5 * dt)
+        system.drift(dt)
+        _after_drift(system, dt)
+        system.kick(acc_half, 0.5 * dt)
+        return None
+    if scheme == 'leapfrog':
+        system.kick(acc, 0.5 * dt)
+        system.drift(dt)
+        _after_drift(system, dt)
+        acc = system.acceleration()
+    else:
+        system.kick(acc, 0.5 * dt)
+        system.drift(dt)
+        _after_drift(system, dt)
+        system.kick(acc, 0.5 * dt)    # forces see the predicted velocity v + a dt
+        acc_new = system.acceleration()
+        system.kick(acc, -0.5 * dt)
+        acc = acc_new
+    system.kick(acc, 0.5 * dt)
+    return acc
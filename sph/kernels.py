@@ -0,0 +1,140 @@
+"""
+SPH smoothing kernels.
+
+One place for the kernels used by Simulaatio, demo.py and the quadrature
+check in ThesisValidation/kernel_partition_check.py. All kernels have
+support 2h and are written as W(r, h) = alpha_D / h^D * f(q), q = r / h:
+
+    - 'cubic': cubic B-spline, alpha_2 = 10/(7 pi), alpha_3 = 1/pi
+    - 'wendland_c2': (1 - q/2)^4 (2q + 1), alpha_2 = 7/(4 pi), alpha_3 = 21/(16 pi)
+    - 'wendland_c4': (1 - q/2)^6 (35/12 q^2 + 3q + 1), alpha_2 = 9/(4 pi), alpha_3 = 495/(256 pi)
+
+get_kernel(name, dim, h, table_size) returns a cached Kernel with the
+normalization sigma = alpha_D / h^D computed once. The kernels take the pair
+distance r as an argument, because the pair pipeline already has it.
+Kernel values keep the precision of r (float32 stays float32).
+
+With table_size > 0, W and the gradient factor (dW/dr) / r are tabulated on a
+uniform grid in q^2 and evaluated by linear interpolation. Interpolating in
+q^2 means the gradient only needs r^2, and (dW/dr) / r stays finite at r = 0.
+"""
+from functools import lru_cache
+
+import numpy as np
+
+_ALPHA = {
+    ('cubic', 2): 10 / (7 * np.pi),
+    ('cubic', 3): 1 / np.pi,
+    ('wendland_c2', 2): 7 / (4 * np.pi),
+    ('wendland_c2', 3): 21 / (16 * np.pi),
+    ('wendland_c4', 2): 9 / (4 * np.pi),
+    ('wendland_c4', 3): 495 / (256 * np.pi),
+}
+
+
+def _cubic(q):
+    f = np.zeros_like(q)
+    df = np.zeros_like(q)
+    mask1 = q <= 1
+    mask2 = (q > 1) & (q <= 2)
+    f[mask1] = 1 - 1.5*q[mask1]**2 + 0.75*q[mask1]**3
+    f[mask2] = 0.25 * (2 - q[mask2])**3
+    df[mask1] = (-3*q[mask1] + 2.25*q[mask1]**2)
+    df[mask2] = -0.75 * (2 - q[mask2])**2
+    return f, df
+
+
+def _wendland_c2(q):
+    t = np.clip(1 - 0.5*q, 0.0, None)
+    return t**4 * (2*q + 1), -5 * q * t**3
+
+
+def _wendland_c4(q):
+    t = np.clip(1 - 0.5*q, 0.0, None)
+    return t**6 * (35/12 * q**2 + 3*q + 1), -(7/3) * q * t**5 * (5*q + 2)
+
+
+def _as_float(r):
+    """r as a floating-point array; float32 input stays float32."""
+    r = np.asarray(r)
+    return r if r.dtype.kind == 'f' else r.astype(float)
+
+
+_SHAPES = {'cubic': _cubic, 'wendland_c2': _wendland_c2, 'wendland_c4': _wendland_c4}
+KERNELS = tuple(_SHAPES)
+
+
+class Kernel:
+    """Kernel with precomputed normalization, optionally tabulated in q^2."""
+
+    support_q = 2.0
+
+    def __init__(self, name, dim, h, table_size=0):
+        if name not in _SHAPES:
+            raise ValueError(f"Unknown kernel: {name}")
+        if (name, dim) not in _ALPHA:
+            raise ValueError("Only D=2 or D=3 supported")
+        self.name = name
+        self.dim = dim
+        self.h = float(h)
+        self.support = self.support_q * self.h
+        self.sigma = _ALPHA[(name, dim)] / self.h**dim
+        self._shape = _SHAPES[name]
+        self.table_size = int(table_size)
+        if self.table_size > 0:
+            q2 = np.linspace(0.0, self.support_q**2, self.table_size)
+            q = np.sqrt(q2)
+            f, df = self._shape(q)
+            self._dq2 = q2[1]
+            # (dW/dr) / r = sigma * f'(q) / (q h^2); f'(q)/q has a finite limit at q = 0
+            with np.errstate(divide='ignore', invalid='ignore'):
+                ratio = np.where(q > 0, df / q, 0.0)
+            ratio[0] = 2 * ratio[1] - ratio[2]
+            self._w_table = np.append(self.sigma * f, 0.0)
+            self._g_table = np.append(self.sigma * ratio / self.h**2, 0.0)
+
+    def _lookup(self, table, r2):
+        x = np.minimum(r2 / (self.h**2 * self._dq2), self.table_size - 1)
+        i0 = x.astype(np.int64)
+        frac = x - i0
+        table = table.astype(x.dtype, copy=False)
+        return table[i0] * (1 - frac) + table[i0 + 1] * frac
+
+    def w(self, r):
+        """Kernel value W(r, h)."""
+        r = _as_float(r)
+        if self.table_size > 0:
+            return self._lookup(self._w_table, r**2)
+        return self.sigma * self._shape(r / self.h)[0]
+
+    def dwdr(self, r):
+        """Radial derivative dW/dr."""
+        r = _as_float(r)
+        return self.sigma * self._shape(r / self.h)[1] / self.h
+
+    def grad(self, rij, r):
+        """Kernel gradient for separation vectors rij (..., dim) with lengths r."""
+        r = _as_float(r)
+        if self.table_size > 0:
+            return rij * self._lookup(self._g_table, r**2)[..., None]
+        q = r / self.h
+        df = self._shape(q)[1]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            scale = np.where(r > 0, df / (r * self.h), 0.0)
+        return self.sigma * rij * scale[..., None]
+
+
+@lru_cache(maxsize=64)
+def get_kernel(name='cubic', dim=2, h=1.0, table_size=0):
+    """Cached Kernel for (name, dim, h, table_size)."""
+    return Kernel(name, dim, h, table_size)
+
+
+def cubic_spline_w(r, h):
+    """Cubic spline kernel (2D) for distances r."""
+    return get_kernel('cubic', 2, h).w(r)
+
+
+def cubic_spline_grad(rij, r, h):
+    """Gradient of the cubic spline kernel (2D) for separation vectors rij with lengths r."""
+    return get_kernel('cubic', 2, h).grad(rij, r)
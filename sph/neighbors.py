@@ -0,0 +1,400 @@
+"""
+Neighbour search backends for 2D SPH.
+
+All backends share one interface (NeighborSearch):
+    - pairs(pos): index arrays (i, j), sorted by i and then j, of all pairs
+      with |pos[j] - pos[i]| < radius. Self pairs (i == i) are included
+      because the SPH density sum needs W(0).
+    - query(points, pos): pairs (k, j) with |pos[j] - points[k]| < radius.
+    - query_last(points, pos=None): the same against the particles of the
+      last pairs() call; the grid backends reuse its cell bins, so e.g. the
+      DEM grains are looked up in the fluid grid without binning it again.
+    - stats(): number of pair list builds and time spent in them.
+Every backend returns exactly the same sorted pairs, so switching backend
+never changes simulation results.
+
+Backends:
+    - BruteForce: all-pairs distance matrix, fastest for small N.
+    - CellList: dense grid over the nominal [0, L] x [0, L] box.
+    - HashedCellList: only occupied cells are stored (sorted int64 cell keys),
+      so particles far outside the box (splashes) cost nothing extra.
+    - KDTreeSearch: scipy cKDTree, robust for strongly non-uniform density.
+make_neighbor_search(kind, ...) builds one by name; kind='auto' times the
+candidates on the initial positions and picks the fastest.
+
+Cell lists: particles are binned into square cells whose side is at least the search
+radius (2h for the cubic spline), so every neighbour of a particle lies in
+its own cell or one of the 8 surrounding cells. Building the bins is a sort,
+and candidate pairs are generated cell by cell with array operations, so one
+search costs O(N) instead of the O(N^2) all-pairs scan.
+
+VerletList wraps any backend and keeps the pair list between steps: it is
+built with radius + skin and only rebuilt once some particle has moved more
+than skin/2 since the last build.
+"""
+import time
+
+import numpy as np
+
+# 3x3 block of cell offsets around a cell (including the cell itself)
+_OFFSETS = np.array([(dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1)], dtype=np.int64)
+
+
+def _within(points, pos, k, j, radius):
+    """Mask of candidate pairs (k, j) closer than radius."""
+    d = pos[j] - points[k]
+    return np.sqrt(d[:, 0]**2 + d[:, 1]**2) < radius
+
+
+def _sorted_pairs(k, j, n):
+    """Sort pairs by (k, j)."""
+    o = np.argsort(k * n + j, kind='stable')
+    return k[o], j[o]
+
+
+class NeighborSearch:
+    """Common interface and bookkeeping of the neighbour search backends."""
+
+    name = None
+
+    def __init__(self, radius):
+        self.radius = float(radius)
+        self.builds = 0
+        self.build_time = 0.0
+        self._last_pos = None
+        self._last_bins = None
+
+    def pairs(self, pos):
+        """All pairs (i, j) with |pos[j] - pos[i]| < radius, self pairs included."""
+        t0 = time.perf_counter()
+        pos = np.asarray(pos, dtype=float)
+        result = self._pairs(pos)
+        self._last_pos = pos
+        self.builds += 1
+        self.build_time += time.perf_counter() - t0
+        return result
+
+    def _pairs(self, pos):
+        return self.query(pos, pos)
+
+    def query_last(self, points, pos=None):
+        """query() against the particles of the last pairs() call (pos: their current positions)."""
+        return self.query(points, self._last_pos if pos is None else pos)
+
+    def query(self, points, pos):
+        """Pairs (k, j) with |pos[j] - points[k]| < radius."""
+        raise NotImplementedError
+
+    def stats(self):
+        """Pair list builds and time spent in them."""
+        return {'builds': self.builds, 'calls': self.builds, 'time': self.build_time}
+
+
+class BruteForce(NeighborSearch):
+    """All-pairs distance scan, O(N^2) but with no setup cost."""
+
+    name = 'brute'
+    chunk = 2048   # query rows per distance block, bounds memory use
+
+    def query(self, points, pos):
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        k_parts, j_parts = [], []
+        for s in range(0, points.shape[0], self.chunk):
+            d = pos[None, :, :] - points[s:s + self.chunk, None, :]
+            k, j = np.nonzero(np.sqrt(d[..., 0]**2 + d[..., 1]**2) < self.radius)
+            k_parts.append(k + s)
+            j_parts.append(j)
+        if not k_parts:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty.copy()
+        return np.concatenate(k_parts), np.concatenate(j_parts)
+
+
+class KDTreeSearch(NeighborSearch):
+    """scipy cKDTree based search."""
+
+    name = 'kdtree'
+
+    def _pairs(self, pos):
+        from scipy.spatial import cKDTree
+        n = pos.shape[0]
+        ij = cKDTree(pos).query_pairs(self.radius, output_type='ndarray')
+        i, j = ij[:, 0].astype(np.int64), ij[:, 1].astype(np.int64)
+        keep = _within(pos, pos, i, j, self.radius)   # the tree uses r <= radius
+        i, j = i[keep], j[keep]
+        self_idx = np.arange(n, dtype=np.int64)
+        return _sorted_pairs(np.concatenate((i, j, self_idx)), np.concatenate((j, i, self_idx)), n)
+
+    def query(self, points, pos):
+        from scipy.spatial import cKDTree
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        hits = cKDTree(pos).query_ball_point(points, self.radius)
+        counts = np.array([len(h) for h in hits], dtype=np.int64)
+        k = np.repeat(np.arange(points.shape[0], dtype=np.int64), counts)
+        j = np.fromiter((x for h in hits for x in h), dtype=np.int64, count=int(counts.sum()))
+        keep = _within(points, pos, k, j, self.radius)
+        return _sorted_pairs(k[keep], j[keep], pos.shape[0])
+
+
+class _GridSearch(NeighborSearch):
+    """Common candidate generation for the grid based searches."""
+
+    def __init__(self, radius):
+        super().__init__(radius)
+        self.cell_size = float(radius)
+
+    def _cells(self, pos):
+        """Integer cell coordinates of the points."""
+        return np.floor(pos / self.cell_size).astype(np.int64)
+
+    def _bin(self, cells):
+        """Sort particles into buckets. Returns the bins (order, start, ...)."""
+        raise NotImplementedError
+
+    def _bucket(self, cells, bins):
+        """Bucket index of each cell, -1 for empty / non-existing cells."""
+        raise NotImplementedError
+
+    def _candidates(self, query_cells, bins):
+        """All (query, particle) index pairs in the 3x3 cell blocks."""
+        order, start = bins[0], bins[1]
+        qi_parts, j_parts = [], []
+        for off in _OFFSETS:
+            b = self._bucket(query_cells + off, bins)
+            valid = b >= 0
+            q = np.nonzero(valid)[0]
+            b = b[valid]
+            first = start[b]
+            counts = start[b + 1] - first
+            total = int(counts.sum())
+            if total == 0:
+                continue
+            # Expand each (query, bucket) into one entry per particle in the bucket
+            qi = np.repeat(q, counts)
+            run_start = np.cumsum(counts) - counts
+            idx = np.arange(total) - np.repeat(run_start - first, counts)
+            qi_parts.append(qi)
+            j_parts.append(order[idx])
+        if not qi_parts:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty.copy()
+        return np.concatenate(qi_parts), np.concatenate(j_parts)
+
+    def _query_bins(self, points, pos, bins):
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        k, j = self._candidates(self._cells(points), bins)
+        keep = _within(points, pos, k, j, self.radius)
+        return _sorted_pairs(k[keep], j[keep], pos.shape[0])
+
+    def query(self, points, pos):
+        return self._query_bins(points, pos, self._bin(self._cells(pos)))
+
+    def _pairs(self, pos):
+        self._last_bins = self._bin(self._cells(pos))
+        return self._query_bins(pos, pos, self._last_bins)
+
+    def query_last(self, points, pos=None):
+        """Pairs against the particles binned by the last pairs() call, without binning them again.
+
+        pos may be their current positions as long as no particle has left
+        its cell's 3x3 block reach (VerletList: moved less than skin / 2).
+        """
+        return self._query_bins(points, self._last_pos if pos is None else pos, self._last_bins)
+
+
+class CellList(_GridSearch):
+    """Uniform-grid neighbour search on the [0, L] x [0, L] box.
+
+    Points outside the box are clamped into the border cells. Clamping keeps
+    the search exact (a clamped point is still compared against everything in
+    the neighbouring border cells), it only makes the border cells fuller.
+    Use HashedCellList when many particles leave the box.
+    """
+
+    name = 'grid'
+
+    def __init__(self, radius, L):
+        super().__init__(radius)
+        self.L = float(L)
+        self.ncell = max(1, int(self.L // self.radius))
+        self.cell_size = self.L / self.ncell
+
+    def _cells(self, pos):
+        c = super()._cells(pos)
+        np.clip(c, 0, self.ncell - 1, out=c)
+        return c
+
+    def _bin(self, cells):
+        cid = cells[:, 0] * self.ncell + cells[:, 1]
+        order = np.argsort(cid, kind='stable')
+        counts = np.bincount(cid, minlength=self.ncell * self.ncell)
+        start = np.concatenate(([0], np.cumsum(counts)))
+        return order, start
+
+    def _bucket(self, cells, bins):
+        inside = np.all((cells >= 0) & (cells < self.ncell), axis=1)
+        return np.where(inside, cells[:, 0] * self.ncell + cells[:, 1], -1)
+
+
+class HashedCellList(_GridSearch):
+    """Spatially hashed cell list for unbounded domains.
+
+    Cell coordinates are packed into int64 keys and only occupied cells are
+    kept, as a sorted key array. Neighbour cells are found with a binary
+    search, so memory and work depend on the particle count only, not on how
+    far particles have splashed out of the nominal box.
+    """
+
+    name = 'hash'
+    _SHIFT = 1 << 20   # supports |cell index| < 2^20 in each direction
+    _BITS = 21
+
+    def _key(self, cells):
+        return ((cells[:, 0] + self._SHIFT) << self._BITS) + (cells[:, 1] + self._SHIFT)
+
+    def _bin(self, cells):
+        cell_keys, inverse = np.unique(self._key(cells), return_inverse=True)
+        inverse = inverse.ravel()
+        order = np.argsort(inverse, kind='stable')
+        counts = np.bincount(inverse, minlength=cell_keys.size)
+        start = np.concatenate(([0], np.cumsum(counts)))
+        return order, start, cell_keys
+
+    def _bucket(self, cells, bins):
+        cell_keys = bins[2]
+        keys = self._key(cells)
+        if cell_keys.size == 0:
+            return np.full(keys.shape[0], -1, dtype=np.int64)
+        b = np.searchsorted(cell_keys, keys)
+        b = np.minimum(b, cell_keys.size - 1)
+        return np.where(cell_keys[b] == keys, b, -1)
+
+
+class VerletList:
+    """Persistent pair list with a skin, rebuilt on particle displacement.
+
+    search must be built with radius cutoff + skin. The cached pairs are
+    filtered to the true cutoff on every call, so the returned pairs are the
+    same as a fresh search would give; only the binning is skipped.
+    """
+
+    def __init__(self, search, cutoff, skin):
+        self.search = search
+        self.name = search.name
+        self.cutoff = float(cutoff)
+        self.skin = float(skin)
+        self.builds = 0
+        self.calls = 0
+        self.build_time = 0.0
+        self.filter_time = 0.0
+        self._ref_pos = None
+        self._last_pos = None
+        self._i = self._j = None
+
+    def needs_rebuild(self, pos):
+        """True if some particle has moved more than skin/2 since the last build."""
+        if self._ref_pos is None or self._ref_pos.shape != pos.shape:
+            return True
+        disp2 = np.max(np.sum((pos - self._ref_pos)**2, axis=1), initial=0.0)
+        return 4.0 * disp2 > self.skin**2
+
+    def pairs(self, pos):
+        """Pairs (i, j) with |pos[j] - pos[i]| < cutoff from the cached list."""
+        self.calls += 1
+        self._last_pos = pos
+        if self.needs_rebuild(pos):
+            t0 = time.perf_counter()
+            self._i, self._j = self.search.pairs(pos)
+            self._ref_pos = pos.copy()
+            self.builds += 1
+            self.build_time += time.perf_counter() - t0
+        t0 = time.perf_counter()
+        keep = _within(pos, pos, self._i, self._j, self.cutoff)
+        self.filter_time += time.perf_counter() - t0
+        return self._i[keep], self._j[keep]
+
+    def query(self, points, pos):
+        """Pairs (k, j) with |pos[j] - points[k]| < cutoff (not cached)."""
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        k, j = self.search.query(points, pos)
+        keep = _within(points, pos, k, j, self.cutoff)
+        return k[keep], j[keep]
+
+    def query_last(self, points, pos=None):
+        """query() through the bins of the last rebuild (pos: defaults to the positions of the last pairs() call)."""
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        pos = np.asarray(self._last_pos if pos is None else pos, dtype=float)
+        k, j = self.search.query_last(points, pos)
+        keep = _within(points, pos, k, j, self.cutoff)
+        return k[keep], j[keep]
+
+    def stats(self):
+        """Rebuild count and total time (rebuilds + per-call filtering)."""
+        return {'builds': self.builds, 'calls': self.calls,
+                'time': self.build_time + self.filter_time}
+
+
+BACKENDS = {cls.name: cls for cls in (BruteForce, CellList, HashedCellList, KDTreeSearch)}
+
+
+def _make(kind, radius, L):
+    if kind not in BACKENDS:
+        raise ValueError(f"Unknown neighbor_search: {kind}")
+    if kind == 'grid':
+        return CellList(radius, L)
+    return BACKENDS[kind](radius)
+
+
+def select_backend(pos, radius, L=None, repeats=2):
+    """Pick the fastest backend for these positions with a short timing probe.
+
+    Candidates are first filtered by problem size: brute force only for small
+    N, the dense grid only when the box is known and not much sparser than the
+    particles (few particles per cell or many outside the box favour the hash),
+    cKDTree only when scipy is installed. Returns (name, {name: seconds}).
+    """
+    pos = np.asarray(pos, dtype=float)
+    n = pos.shape[0]
+    candidates = ['hash']
+    if n <= 4000:
+        candidates.append('brute')
+    if L is not None:
+        ncell = max(1, int(L // radius))**2
+        outside = np.mean(np.any((pos < 0) | (pos > L), axis=1)) if n else 0.0
+        if ncell <= 4 * n + 64 and outside < 0.1:
+            candidates.append('grid')
+    try:
+        import scipy.spatial  # noqa: F401
+        candidates.append('kdtree')
+    except ImportError:
+        pass
+    timings = {}
+    for kind in candidates:
+        search = _make(kind, radius, L)
+        best = np.inf
+        for _ in range(repeats):
+            t0 = time.perf_counter()
+            search.pairs(pos)
+            best = min(best, time.perf_counter() - t0)
+        timings[kind] = best
+    return min(timings, key=timings.get), timings
+
+
+def make_neighbor_search(kind, radius, L=None, pos=None):
+    """Build a neighbour search backend by name ('brute', 'grid', 'hash', 'kdtree' or 'auto').
+
+    'auto' needs the initial positions pos for the timing probe; 'grid' needs
+    the box size L.
+    """
+    if kind == 'auto':
+        if pos is None:
+            raise ValueError("neighbor_search='auto' needs initial positions")
+        kind, _ = select_backend(pos, radius, L)
+    if kind == 'grid' and L is None:
+        raise ValueError("neighbor_search='grid' needs the box size L")
+    return _make(kind, radius, L)
+
+
+def neighbor_offsets(i, n):
+    """CSR offsets of a pair list sorted by i: neighbours of a are j[start[a]:start[a+1]]."""
+    return np.concatenate(([0], np.cumsum(np.bincount(i, minlength=n))))
@@ -0,0 +1,135 @@
+"""
+Optional Numba-compiled compute engine for Simulaatio (engine='numba').
+
+The SPH density/force passes run as @njit(parallel=True) loops over the
+neighbour lists produced by the cell list (CSR form: neighbours of a are
+nbr[start[a]:start[a+1]]). Every particle only gathers from its neighbours,
+so the parallel loop has no write conflicts. The DEM wall-contact loop of
+paivita_dem is compiled the same way, one grain per iteration.
+
+Kernels are compiled with cache=True, so the machine code is stored on disk
+(__pycache__ next to this file, or NUMBA_CACHE_DIR) and sweep worker
+processes load it instead of paying the JIT cost on every start.
+
+Accuracy: the loops follow the NumPy pair operators term by term and sum the
+neighbours in the same order, so one step agrees with engine='numpy' to
+rounding (relative difference below 1e-12, checked in test_sph.py). Longer
+runs of the default, strongly compressible setup are chaotic and such
+rounding differences grow, as they do between any two summation orders.
+
+If Numba is not installed NUMBA_AVAILABLE is False and Simulaatio falls back
+to the NumPy engine with a warning.
+"""
+import math
+
+import numpy as np
+
+try:
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+    prange = range
+
+    def njit(*args, **kwargs):
+        """Stand-in decorator: leaves the function as plain Python."""
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda f: f
+
+
+@njit(cache=True)
+def _cubic_w(q):
+    """Cubic spline polynomial (without sigma)."""
+    if q <= 1.0:
+        return 1 - 1.5*q**2 + 0.75*q**3
+    if q <= 2.0:
+        return 0.25 * (2 - q)**3
+    return 0.0
+
+
+@njit(cache=True)
+def _cubic_dw(q):
+    """Derivative factor of the cubic spline polynomial (without sigma)."""
+    if q <= 1.0:
+        return -3*q + 2.25*q**2
+    if q <= 2.0:
+        return -0.75 * (2 - q)**2
+    return 0.0
+
+
+@njit(parallel=True, cache=True)
+def sph_density(pos, start, nbr, m, h):
+    """SPH density rho_a = sum_b m W_ab over the neighbour lists."""
+    n = pos.shape[0]
+    sigma = 10 / (7 * np.pi * h**2)
+    rho = np.empty(n)
+    for a in prange(n):
+        s = 0.0
+        for t in range(start[a], start[a + 1]):
+            b = nbr[t]
+            dx = pos[b, 0] - pos[a, 0]
+            dy = pos[b, 1] - pos[a, 1]
+            r = math.sqrt(dx**2 + dy**2)
+            s += m * (sigma * _cubic_w(r / h))
+        rho[a] = s
+    return rho
+
+
+@njit(parallel=True, cache=True)
+def sph_forces(pos, vel, rho, p, start, nbr, m, h, mu):
+    """Pressure + viscous acceleration, same terms as sph.operators."""
+    n = pos.shape[0]
+    sigma = 10 / (7 * np.pi * h**2)
+    acc = np.empty((n, 2))
+    for a in prange(n):
+        px = 0.0
+        py = 0.0
+        vx = 0.0
+        vy = 0.0
+        for t in range(start[a], start[a + 1]):
+            b = nbr[t]
+            dx = pos[b, 0] - pos[a, 0]
+            dy = pos[b, 1] - pos[a, 1]
+            r = math.sqrt(dx**2 + dy**2)
+            q = r / h
+            coef = m * (p[a] / rho[a]**2 + p[b] / rho[b]**2)
+            if r > 0:
+                scale = _cubic_dw(q) / (r * h)
+                px += coef * (sigma * (dx * scale))
+                py += coef * (sigma * (dy * scale))
+            wv = m * (sigma * _cubic_w(q)) / rho[b]
+            vx += wv * (vel[b, 0] - vel[a, 0])
+            vy += wv * (vel[b, 1] - vel[a, 1])
+        acc[a, 0] = -px + mu * vx
+        acc[a, 1] = -py + mu * vy
+    return acc
+
+
+@njit(parallel=True, cache=True)
+def dem_wall_acceleration(dem_pos, dem_vel, react, g_y, x, y, width, height, r, m, k, gamma):
+    """Gravity, SPH reaction and wall penalty forces of the damper grains.
+
+    Mirrors the per-grain loop of Simulaatio.paivita_dem, including the
+    velocity reversal (factor -gamma) on wall contact; dem_vel is updated in
+    place and the acceleration is returned.
+    """
+    n = dem_pos.shape[0]
+    acc = np.zeros((n, 2))
+    for i in prange(n):
+        acc[i, 1] += g_y
+        acc[i, 0] += react[i, 0] / m
+        acc[i, 1] += react[i, 1] / m
+        if dem_pos[i, 0] - r < x:
+            acc[i, 0] += k * (x - (dem_pos[i, 0] - r)) / m
+            dem_vel[i, 0] *= -gamma
+        if dem_pos[i, 0] + r > x + width:
+            acc[i, 0] -= k * ((dem_pos[i, 0] + r) - (x + width)) / m
+            dem_vel[i, 0] *= -gamma
+        if dem_pos[i, 1] - r < y:
+            acc[i, 1] += k * (y - (dem_pos[i, 1] - r)) / m
+            dem_vel[i, 1] *= -gamma
+        if dem_pos[i, 1] + r > y + height:
+            acc[i, 1] -= k * ((dem_pos[i, 1] + r) - (y + height)) / m
+            dem_vel[i, 1] *= -gamma
+    return acc
@@ -0,0 +1,117 @@
+"""
+Structure-of-arrays particle store.
+
+ParticleSet keeps every per-particle quantity in its own contiguous array
+(x, v, f: (capacity, 2); m, rho, p: (capacity,); phase: (capacity,) int8)
+instead of one Python object per particle. The first n rows are the active
+particles; the properties return views of them, so pair operators and
+compiled kernels work on the arrays directly.
+
+Capacity grows geometrically, so add() only reallocates O(log N) times in
+total, and remove()/reorder() work in place on the existing buffers.
+The buffers come from allocator(shape, dtype) (default np.zeros);
+reallocate() moves them to another allocator, e.g. shared memory for the
+worker processes of sph.domain.
+"""
+import numpy as np
+
+PHASE_FLUID = 0
+PHASE_DEM = 1
+
+_VECTOR_FIELDS = ('x', 'v', 'f')
+_SCALAR_FIELDS = ('m', 'rho', 'p')
+
+
+class ParticleSet:
+    """Contiguous particle arrays with per-phase tags."""
+
+    def __init__(self, capacity=0, dim=2, dtype=np.float64, allocator=None):
+        self.dim = dim
+        self.dtype = np.dtype(dtype)
+        self.n = 0
+        self.allocator = allocator
+        self._alloc(max(int(capacity), 1))
+
+    def _alloc(self, capacity):
+        """(Re)allocate the buffers with the given capacity, keeping active rows."""
+        zeros = self.allocator or np.zeros
+        old = {name: getattr(self, '_' + name, None) for name in _VECTOR_FIELDS + _SCALAR_FIELDS + ('phase',)}
+        for name in _VECTOR_FIELDS:
+            setattr(self, '_' + name, zeros((capacity, self.dim), self.dtype))
+        for name in _SCALAR_FIELDS:
+            setattr(self, '_' + name, zeros((capacity,), self.dtype))
+        self._phase = zeros((capacity,), np.int8)
+        for name, arr in old.items():
+            if arr is not None:
+                getattr(self, '_' + name)[:self.n] = arr[:self.n]
+        self.capacity = capacity
+
+    def __len__(self):
+        return self.n
+
+    def reallocate(self, allocator=None):
+        """Move the buffers to allocator(shape, dtype) (None: np.zeros), keeping the particles."""
+        self.allocator = allocator
+        self._alloc(self.capacity)
+
+    def buffers(self):
+        """Full-capacity buffers by field name."""
+        return {name: getattr(self, '_' + name) for name in _VECTOR_FIELDS + _SCALAR_FIELDS + ('phase',)}
+
+    def __getstate__(self):
+        # Pickled (checkpoints) as plain arrays; a shared-memory allocator is not carried over
+        state = self.__dict__.copy()
+        state['allocator'] = None
+        return state
+
+    def add(self, x, v=None, m=0.0, rho=0.0, phase=PHASE_FLUID):
+        """Append particles (x: (k, dim)). Returns the indices of the new particles."""
+        x = np.asarray(x, dtype=self.dtype).reshape(-1, self.dim)
+        k = x.shape[0]
+        if self.n + k > self.capacity:
+            self._alloc(max(self.n + k, 2 * self.capacity))
+        sl = slice(self.n, self.n + k)
+        self._x[sl] = x
+        self._v[sl] = 0.0 if v is None else v
+        self._f[sl] = 0.0
+        self._m[sl] = m
+        self._rho[sl] = rho
+        self._p[sl] = 0.0
+        self._phase[sl] = phase
+        self.n += k
+        return np.arange(sl.start, sl.stop)
+
+    def remove(self, idx):
+        """Remove particles by index, keeping the order of the remaining ones."""
+        keep = np.ones(self.n, dtype=bool)
+        keep[idx] = False
+        k = int(keep.sum())
+        for name in _VECTOR_FIELDS + _SCALAR_FIELDS + ('phase',):
+            buf = getattr(self, '_' + name)
+            buf[:k] = buf[:self.n][keep]
+        self.n = k
+
+    def reorder(self, perm):
+        """Permute the active particles in place (e.g. sort by cell for memory locality)."""
+        perm = np.asarray(perm)
+        for name in _VECTOR_FIELDS + _SCALAR_FIELDS + ('phase',):
+            buf = getattr(self, '_' + name)
+            buf[:self.n] = buf[:self.n][perm]
+
+    def select(self, phase):
+        """Indices of the active particles of one phase."""
+        return np.nonzero(self.phase == phase)[0]
+
+
+def _field(name):
+    def get(self):
+        return getattr(self, '_' + name)[:self.n]
+
+    def set(self, value):
+        getattr(self, '_' + name)[:self.n] = value
+
+    return property(get, set, doc=f"Active rows of the {name} array (view).")
+
+
+for _name in _VECTOR_FIELDS + _SCALAR_FIELDS + ('phase',):
+    setattr(ParticleSet, _name, _field(_name))
@@ -0,0 +1,177 @@
+"""
+Chunked, append-only particle snapshot files.
+
+A snapshot directory holds one subdirectory per field and an index of the
+frame times:
+
+    meta.json           fields, particle count, dtype, frames per chunk
+    times.f8            frame times, raw float64, appended chunk by chunk
+    <field>/000000.npz  frames 0 .. frames_per_chunk-1 of one field, shape
+                        (frames, n) or (frames, n, 2); .npy when compress=False
+
+SnapshotWriter buffers frames_per_chunk frames in preallocated arrays and
+writes a chunk when the buffer is full (and the last partial chunk on
+close()). The times of a chunk are appended only after its data is on disk,
+so a reader never sees a frame that is not complete. A writer restored from
+a checkpoint (sph.checkpoint) continues after the checkpointed frame: its
+first flush drops the later frames from the index. Loading a checkpoint
+itself never touches the files, and fork(path) moves a restored writer to a
+new directory (copying the frames up to the checkpoint), so several branches
+of one checkpoint keep their own snapshots.
+
+SnapshotReader maps the time index and reads single frames or particle
+subsets chunk by chunk: uncompressed chunks are memory-mapped, compressed
+chunks are decompressed one chunk at a time, never the whole run.
+"""
+import json
+import os
+import shutil
+
+import numpy as np
+
+SNAPSHOT_FIELDS = ('x', 'v', 'rho', 'p')
+_VECTOR_FIELDS = ('x', 'v', 'f')
+
+
+def _shape(name, n, dim):
+    return (n, dim) if name in _VECTOR_FIELDS else (n,)
+
+
+def snapshot_fields_from_config(cfg):
+    """Fields to save from the output section of base_config.yaml."""
+    out = cfg.get('output', {})
+    fields = []
+    if out.get('save_positions', False):
+        fields.append('x')
+    if out.get('save_velocity', False):
+        fields.append('v')
+    if out.get('save_pressure', False):
+        fields += ['rho', 'p']
+    return tuple(fields)
+
+
+class SnapshotWriter:
+    """Append particle fields frame by frame into chunked files."""
+
+    def __init__(self, path, n, fields=SNAPSHOT_FIELDS, dim=2, dtype=np.float64, frames_per_chunk=16,
+                 compress=True):
+        self.path = path
+        self.n = int(n)
+        self.fields = tuple(fields)
+        self.dim = dim
+        self.dtype = np.dtype(dtype)
+        self.frames_per_chunk = int(frames_per_chunk)
+        self.compress = compress
+        os.makedirs(path, exist_ok=True)
+        for name in self.fields:
+            os.makedirs(os.path.join(path, name), exist_ok=True)
+        meta = {'fields': list(self.fields), 'n': self.n, 'dim': dim, 'dtype': self.dtype.str,
+                'frames_per_chunk': self.frames_per_chunk, 'compress': compress}
+        with open(os.path.join(path, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+        open(os.path.join(path, 'times.f8'), 'wb').close()
+        self._buf = {name: np.empty((self.frames_per_chunk,) + _shape(name, self.n, dim), dtype=self.dtype)
+                     for name in self.fields}
+        self._times = np.empty(self.frames_per_chunk)
+        self._fill = 0
+        self.frames_written = 0
+
+    def append(self, t, **values):
+        """Add one frame at time t; values holds an array for every field."""
+        for name in self.fields:
+            self._buf[name][self._fill] = values[name]
+        self._times[self._fill] = t
+        self._fill += 1
+        if self._fill == self.frames_per_chunk:
+            self.flush()
+
+    def flush(self):
+        """Write the buffered frames as one chunk.
+
+        A partial chunk (from close()) stays in the buffer and is rewritten
+        with the following frames, so every chunk but the last is full.
+        """
+        if self._fill == 0:
+            return
+        chunk = self.frames_written // self.frames_per_chunk
+        for name in self.fields:
+            data = self._buf[name][:self._fill]
+            target = os.path.join(self.path, name, f"{chunk:06d}")
+            if self.compress:
+                np.savez_compressed(target + '.npz', data=data)
+            else:
+                np.save(target + '.npy', data)
+        self._truncate_times()
+        with open(os.path.join(self.path, 'times.f8'), 'ab') as f:
+            self._times[:self._fill].tofile(f)
+        if self._fill == self.frames_per_chunk:
+            self.frames_written += self._fill
+            self._fill = 0
+
+    def _truncate_times(self):
+        with open(os.path.join(self.path, 'times.f8'), 'r+b') as f:
+            f.truncate(8 * self.frames_written)
+
+    def close(self):
+        """Write the buffered frames."""
+        self.flush()
+
+    def fork(self, path):
+        """Continue in a new directory that starts with the frames written so far."""
+        os.makedirs(path, exist_ok=True)
+        shutil.copy(os.path.join(self.path, 'meta.json'), os.path.join(path, 'meta.json'))
+        chunks = self.frames_written // self.frames_per_chunk
+        suffix = '.npz' if self.compress else '.npy'
+        for name in self.fields:
+            os.makedirs(os.path.join(path, name), exist_ok=True)
+            for chunk in range(chunks):
+                shutil.copy(os.path.join(self.path, name, f"{chunk:06d}{suffix}"), os.path.join(path, name))
+        times = np.fromfile(os.path.join(self.path, 'times.f8'), count=self.frames_written)
+        times.tofile(os.path.join(path, 'times.f8'))
+        self.path = path
+
+
+class SnapshotReader:
+    """Random access to the frames of a snapshot directory."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        self.fields = tuple(meta['fields'])
+        self.n = meta['n']
+        self.frames_per_chunk = meta['frames_per_chunk']
+        self.compress = meta['compress']
+        self._cache = (None, None, None)
+
+    @property
+    def times(self):
+        """Frame times (memory-mapped index)."""
+        path = os.path.join(self.path, 'times.f8')
+        if os.path.getsize(path) == 0:
+            return np.zeros(0)
+        return np.memmap(path, dtype=np.float64, mode='r')
+
+    def __len__(self):
+        return os.path.getsize(os.path.join(self.path, 'times.f8')) // 8
+
+    def _chunk(self, name, chunk):
+        if self.compress:
+            # Keep the last decompressed chunk, consecutive frames usually share it
+            if self._cache[:2] != (name, chunk) or len(self._cache[2]) < min(self.frames_per_chunk, len(self)
+                                                                           - chunk * self.frames_per_chunk):
+                with np.load(os.path.join(self.path, name, f"{chunk:06d}.npz")) as data:
+                    self._cache = (name, chunk, data['data'])
+            return self._cache[2]
+        return np.load(os.path.join(self.path, name, f"{chunk:06d}.npy"), mmap_mode='r')
+
+    def field(self, name, frame, particles=None):
+        """One field of one frame, optionally only the given particles."""
+        if not 0 <= frame < len(self):
+            raise IndexError(f"frame {frame} out of range")
+        data = self._chunk(name, frame // self.frames_per_chunk)[frame % self.frames_per_chunk]
+        return np.array(data if particles is None else data[particles])
+
+    def frame(self, frame, fields=None, particles=None):
+        """Dict of fields of one frame."""
+        return {name: self.field(name, frame, particles) for name in (fields or self.fields)}
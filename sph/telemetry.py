@@ -0,0 +1,169 @@
+"""
+Columnar time-series recorder for per-step solver output.
+
+TelemetryRecorder keeps one preallocated NumPy column per channel and
+appends one row per record() call, instead of growing Python lists. Columns
+are filled in chunks of chunk_size values:
+
+    - in memory, full chunks are kept as arrays and concatenated once at the end
+    - with spill_dir, full chunks are appended to one .npy file per channel
+      by a background thread, so memory use stays at one chunk per channel;
+      arrays() writes the final row count into the file headers and returns
+      read-only memory maps, without copying the data; fork() continues a
+      restored recorder in a new directory
+
+Each channel can be decimated: with decimate k only every k-th record() call
+is stored, and steps(name) gives the record indices that were kept.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+
+class TelemetryRecorder:
+    """Preallocated, optionally decimated and disk-spilled per-step channels."""
+
+    def __init__(self, channels, chunk_size=4096, decimate=1, spill_dir=None):
+        if isinstance(channels, dict):
+            self.dtypes = {name: np.dtype(dt) for name, dt in channels.items()}
+        else:
+            self.dtypes = {name: np.dtype(np.float64) for name in channels}
+        if isinstance(decimate, dict):
+            self.decimate = {name: int(decimate.get(name, 1)) for name in self.dtypes}
+        else:
+            self.decimate = dict.fromkeys(self.dtypes, int(decimate))
+        if min(self.decimate.values(), default=1) < 1:
+            raise ValueError("decimate must be >= 1")
+        self.chunk_size = int(chunk_size)
+        self.spill_dir = spill_dir
+        self.n = 0
+        self._buf = {name: np.empty(self.chunk_size, dtype=dt) for name, dt in self.dtypes.items()}
+        self._fill = dict.fromkeys(self.dtypes, 0)
+        self._chunks = {name: [] for name in self.dtypes}
+        self._written = dict.fromkeys(self.dtypes, 0)
+        self._pending = []
+        self._writer = None
+        if spill_dir is not None:
+            os.makedirs(spill_dir, exist_ok=True)
+            for name, dt in self.dtypes.items():
+                with open(self._path(name), 'wb') as f:
+                    _write_header(f, dt, 0)
+            self._writer = ThreadPoolExecutor(max_workers=1)
+
+    def __len__(self):
+        return self.n
+
+    def record(self, **values):
+        """Append one row; every channel must be given."""
+        for name, buf in self._buf.items():
+            if self.n % self.decimate[name]:
+                continue
+            fill = self._fill[name]
+            buf[fill] = values[name]
+            self._fill[name] = fill + 1
+            if fill + 1 == self.chunk_size:
+                self._flush(name)
+        self.n += 1
+
+    def _flush(self, name):
+        """Move the full buffer of a channel to the chunk list or to disk."""
+        chunk = self._buf[name][:self._fill[name]]
+        if self._writer is not None:
+            start = self._written[name]
+            self._pending.append(self._writer.submit(self._write_rows, name, start, chunk))
+            self._written[name] = start + chunk.shape[0]
+        else:
+            self._chunks[name].append(chunk)
+        self._buf[name] = np.empty(self.chunk_size, dtype=self.dtypes[name])
+        self._fill[name] = 0
+
+    def _path(self, name):
+        return os.path.join(self.spill_dir, f"{name}.npy")
+
+    def _write_rows(self, name, start, rows):
+        """Write rows at row index start of the channel file (header shape is set by arrays())."""
+        with open(self._path(name), 'r+b') as f:
+            np.lib.format.read_magic(f)
+            np.lib.format.read_array_header_1_0(f)
+            f.seek(start * rows.dtype.itemsize, os.SEEK_CUR)
+            f.write(rows.tobytes())
+
+    def fork(self, spill_dir):
+        """Continue in a new directory that starts with the rows written so far."""
+        for future in self._pending:
+            future.result()
+        self._pending = []
+        os.makedirs(spill_dir, exist_ok=True)
+        for name, dt in self.dtypes.items():
+            with open(self._path(name), 'rb') as src, open(os.path.join(spill_dir, f"{name}.npy"), 'wb') as dst:
+                np.lib.format.read_magic(src)
+                np.lib.format.read_array_header_1_0(src)
+                _write_header(dst, dt, 0)
+                np.fromfile(src, dtype=dt, count=self._written[name]).tofile(dst)
+        self.spill_dir = spill_dir
+
+    def overwrites(self):
+        """True if arrays() of another run has already published more rows in spill_dir than this state wrote."""
+        for name in self.dtypes:
+            if not os.path.exists(self._path(name)):
+                continue
+            with open(self._path(name), 'rb') as f:
+                np.lib.format.read_magic(f)
+                shape = np.lib.format.read_array_header_1_0(f)[0]
+            if shape[0] > self._written[name]:
+                return True
+        return False
+
+    def steps(self, name):
+        """Record indices stored in channel name."""
+        return np.arange(0, self.n, self.decimate[name])
+
+    def arrays(self):
+        """All channels as arrays (memory maps of the joined files when spilling to disk)."""
+        if self._writer is None:
+            return {name: np.concatenate(self._chunks[name] + [self._buf[name][:self._fill[name]]])
+                    for name in self.dtypes}
+        for name in self.dtypes:
+            if self._fill[name]:
+                self._flush(name)
+        for future in self._pending:
+            future.result()
+        self._pending = []
+        out = {}
+        for name, dt in self.dtypes.items():
+            n = self._written[name]
+            with open(self._path(name), 'r+b') as f:
+                # numpy pads the header for a growing first axis: the data offset stays the same
+                _write_header(f, dt, n)
+                f.truncate(f.tell() + n * dt.itemsize)
+            out[name] = np.load(self._path(name), mmap_mode='r')
+        return out
+
+    def __getstate__(self):
+        # Pickling (checkpoints) waits for pending writes; the writer thread is recreated on load
+        for future in self._pending:
+            future.result()
+        state = self.__dict__.copy()
+        state['_pending'] = []
+        state['_writer'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.spill_dir is not None:
+            os.makedirs(self.spill_dir, exist_ok=True)
+            self._writer = ThreadPoolExecutor(max_workers=1)
+
+    def close(self):
+        """Finish pending writes and stop the writer thread."""
+        if self._writer is not None:
+            for future in self._pending:
+                future.result()
+            self._writer.shutdown()
+
+
+def _write_header(f, dtype, n):
+    """.npy header of a one-dimensional array of n values."""
+    np.lib.format.write_array_header_1_0(f, {'descr': np.lib.format.dtype_to_descr(dtype), 'fortran_order': False,
+                                             'shape': (n,)})
@@ -0,0 +1,86 @@
+"""
+Adaptive time stepping for the native SPH-DEM solver.
+
+The stable step is the minimum of the usual explicit criteria:
+    - sound-speed CFL:  dt_cfl   = CFL * h / (c + |v|max)
+    - viscous:          dt_visc  = 0.125 * h^2 / nu
+    - force:            dt_force = 0.25 * sqrt(h / |a|max)
+    - DEM contact:      dt_dem   = T_contact / 20, T_contact = 2 pi sqrt(m / k)
+and is clamped to [dt_min, dt_max]. The step may grow at most by
+max_growth per step, so one calm step does not jump straight to dt_max.
+
+time_options_from_config() reads the corresponding entries of
+base_config.yaml (simulation.time.*, integration.*_time_step,
+integration.scheme).
+"""
+import numpy as np
+
+DEM_STEPS_PER_PERIOD = 20
+
+
+def contact_period(m, k):
+    """Natural period 2 pi sqrt(m / k) of a linear contact spring."""
+    return 2 * np.pi * np.sqrt(m / k)
+
+
+def stable_time_step(h, c, v_max=0.0, a_max=0.0, nu=0.0, cfl=0.7, dem_m=None, dem_k=None):
+    """Stable explicit step and the individual criteria as a dict."""
+    criteria = {'cfl': cfl * h / (c + v_max)}
+    if nu > 0:
+        criteria['viscous'] = 0.125 * h**2 / nu
+    if a_max > 0:
+        criteria['force'] = 0.25 * np.sqrt(h / a_max)
+    if dem_m is not None and dem_k:
+        criteria['dem'] = contact_period(dem_m, dem_k) / DEM_STEPS_PER_PERIOD
+    return min(criteria.values()), criteria
+
+
+class AdaptiveTimeStep:
+    """Time step controller: stable step clamped to [dt_min, dt_max] with limited growth."""
+
+    def __init__(self, dt_min=1e-6, dt_max=None, cfl=0.7, max_growth=1.25):
+        self.dt_min = dt_min
+        self.dt_max = dt_max
+        self.cfl = cfl
+        self.max_growth = max_growth
+        self.dt = None
+        self.limiting = None
+
+    def next(self, t_remaining=None, **state):
+        """Next step from the current solver state (arguments of stable_time_step)."""
+        dt, criteria = stable_time_step(cfl=self.cfl, **state)
+        self.limiting = min(criteria, key=criteria.get)
+        if self.dt is not None:
+            dt = min(dt, self.max_growth * self.dt)
+        if self.dt_max is not None:
+            dt = min(dt, self.dt_max)
+        dt = max(dt, self.dt_min)
+        if t_remaining is not None and dt > t_remaining:
+            dt = t_remaining
+        else:
+            self.dt = dt
+        return dt
+
+
+def resample(t, values, interval, t_end):
+    """Linear interpolation of a history onto the fixed output times interval, 2*interval, ... <= t_end."""
+    n_out = int(np.floor(t_end / interval + 1e-9))
+    t_out = interval * np.arange(1, n_out + 1)
+    return t_out, np.interp(t_out, t, np.asarray(values, dtype=float))
+
+
+def time_options_from_config(cfg):
+    """Simulaatio time-stepping options from a base_config.yaml dict."""
+    time_cfg = cfg.get('simulation', {}).get('time', {})
+    integ = cfg.get('integration', {})
+    adaptive = time_cfg.get('time_step_mode') == 'auto' or bool(integ.get('adaptive_time_step', False))
+    options = {'adaptive': adaptive}
+    # PyYAML reads values like 1e-4 (no decimal point) as strings, hence float()
+    for key, src, name in (('t_end', time_cfg, 't_end'), ('output_interval', time_cfg, 'output_interval'),
+                           ('cfl', time_cfg, 'CFL'), ('dt_min', integ, 'min_time_step'),
+                           ('dt_max', integ, 'max_time_step')):
+        if name in src:
+            options[key] = float(src[name])
+    if 'scheme' in integ:
+        options['integrator'] = integ['scheme']
+    return options
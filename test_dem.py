@@ -0,0 +1,186 @@
+"""
+Unit tests for the DEM contact engine (dem package)
+"""
+import random
+import unittest
+import numpy as np
+from dem.engine import ContactEngine
+from dem.history import ContactHistory, pack_pairs, unpack_pairs
+from dem.models import HertzMindlin, LinearSpringDashpot, contact_model_from_config
+from sph_2d_example import Simulaatio
+from test_simulation import BASE_PARAMS
+
+
+def collide(model, v0=1.0, r=0.01, m=0.01, dt=1e-6):
+    """Head-on collision of two grains; returns the rebound speed ratio."""
+    engine = ContactEngine(model, r, m)
+    pos = np.array([[0.0, 0.0], [2 * r + 1e-6, 0.0]])
+    vel = np.array([[v0 / 2, 0.0], [-v0 / 2, 0.0]])
+    for _ in range(200000):
+        vel += engine.forces(pos, vel) / m * dt
+        pos += vel * dt
+        if vel[1, 0] - vel[0, 0] > 0 and engine.n_contacts == 0:
+            break
+    return (vel[1, 0] - vel[0, 0]) / v0
+
+
+class TestContactModels(unittest.TestCase):
+    def test_linear_restitution(self):
+        # Without tensile force the grains separate a little before the overlap closes: e slightly higher
+        e = collide(LinearSpringDashpot(1e4, restitution=0.4))
+        self.assertGreaterEqual(e, 0.4)
+        self.assertLess(e, 0.5)
+        self.assertAlmostEqual(collide(LinearSpringDashpot(1e4, restitution=1.0)), 1.0, delta=1e-3)
+
+    def test_hertz_mindlin_restitution_and_stiffening(self):
+        model = HertzMindlin(1e8, poisson=0.3, restitution=0.6)
+        self.assertAlmostEqual(collide(model), 0.6, delta=0.05)
+        overlap = np.array([1e-5, 4e-5])
+        f = model.normal_force(overlap, np.zeros(2), 0.005, 0.005)
+        self.assertAlmostEqual(f[1] / f[0], 8.0)     # F ~ overlap^(3/2)
+        self.assertEqual(model.normal_force(np.array([1e-5]), np.array([100.0]), 0.005, 0.005)[0], 0.0)
+
+    def test_from_config(self):
+        cfg = {'dem': {'contact_model': 'Hertz-Mindlin', 'youngs_modulus': '1.0e9', 'poisson': 0.3,
+                       'restitution_coeff': 0.4}}
+        model = contact_model_from_config(cfg)
+        self.assertIsInstance(model, HertzMindlin)
+        self.assertEqual(model.youngs_modulus, 1e9)
+        self.assertIsInstance(contact_model_from_config({'dem': {'contact_model': 'linear'}}, k_n=5000.0),
+                              LinearSpringDashpot)
+        with self.assertRaises(ValueError):
+            contact_model_from_config({'dem': {'contact_model': 'linear'}})
+        cfg['dem'].update(friction_coeff_static=0.5, friction_coeff_dynamic=0.45)
+        model = contact_model_from_config(cfg)
+        self.assertEqual((model.friction_static, model.friction_dynamic), (0.5, 0.45))
+        with self.assertRaises(ValueError):
+            LinearSpringDashpot(1e3, friction_static=0.3, friction_dynamic=0.4)
+
+
+class TestContactHistory(unittest.TestCase):
+    def test_values_carried_inserted_and_deleted(self):
+        history = ContactHistory()
+        keys = pack_pairs([0, 0, 2], [1, 5, 3])
+        np.testing.assert_array_equal(unpack_pairs(keys)[1], [1, 5, 3])
+        values = history.update(keys)
+        np.testing.assert_array_equal(values, 0.0)
+        history.store(np.array([[1.0, 1.0], [2.0, 2.0], [3.0, 3.0]]))
+        # (0, 5) ends, (1, 4) starts
+        values = history.update(pack_pairs([0, 1, 2], [1, 4, 3]))
+        np.testing.assert_array_equal(values[:, 0], [1.0, 0.0, 3.0])
+        self.assertEqual((history.inserted, history.deleted, len(history)), (4, 1, 3))
+
+    def test_unsorted_keys(self):
+        history = ContactHistory()
+        history.update(np.array([7, 3, 5]))
+        history.store(np.array([[7.0, 0], [3.0, 0], [5.0, 0]]))
+        np.testing.assert_array_equal(history.keys, [3, 5, 7])
+        np.testing.assert_array_equal(history.update(np.array([5, 9, 7]))[:, 0], [5.0, 0.0, 7.0])
+        np.testing.assert_array_equal(history.lookup(np.array([5, 6])), [0, -1])
+
+
+class TestContactEngine(unittest.TestCase):
+    def test_pairs_match_brute_force(self):
+        rng = np.random.default_rng(3)
+        n, r = 3000, 0.004
+        pos = rng.uniform(0.0, 0.5, size=(n, 2))
+        vel = rng.normal(size=(n, 2))
+        engine = ContactEngine(LinearSpringDashpot(1e3), r, 0.001)
+        force = engine.forces(pos, vel)
+        d = np.linalg.norm(pos[None, :, :] - pos[:, None, :], axis=-1)
+        i, j = np.nonzero(np.triu(d < 2 * r, k=1))
+        self.assertEqual(engine.n_contacts, i.size)
+        self.assertGreater(i.size, 100)
+        # Internal forces cancel: total momentum is conserved
+        self.assertLess(np.abs(force.sum(axis=0)).max(), 1e-9 * np.abs(force).sum())
+
+    def test_wall_forces(self):
+        engine = ContactEngine(LinearSpringDashpot(100.0, restitution=1.0), 0.1, 1.0)
+        pos = np.array([[0.05, 0.5], [0.5, 0.5], [0.95, 0.97]])
+        vel = np.zeros((3, 2))
+        force = engine.forces(pos, vel, box=(0.0, 0.0, 1.0, 1.0))
+        np.testing.assert_allclose(force, [[5.0, 0.0], [0.0, 0.0], [-5.0, -7.0]])
+        self.assertEqual(engine.n_wall_contacts, 3)
+        # A wall moving into a resting grain pushes it like a grain moving into the wall
+        damped = ContactEngine(LinearSpringDashpot(100.0, restitution=0.5), 0.1, 1.0)
+        moving = damped.wall_forces(pos[:1], np.zeros((1, 2)), (0.0, 0.0, 1.0, 1.0), box_vel=(1.0, 0.0))
+        still = damped.wall_forces(pos[:1], np.array([[-1.0, 0.0]]), (0.0, 0.0, 1.0, 1.0))
+        np.testing.assert_allclose(moving, still)
+        self.assertGreater(moving[0, 0], 5.0)
+
+    def slide(self, model, v0, push=0.0, steps=5000, dt=1e-5):
+        """Grain resting on the floor with initial speed v0 and a horizontal push; returns x, vx."""
+        r, m, g = 0.01, 0.01, 9.81
+        engine = ContactEngine(model, r, m)
+        pos = np.array([[0.5, r - m * g / model.k_n]])
+        vel = np.array([[v0, 0.0]])
+        for _ in range(steps):
+            acc = engine.forces(pos, vel, box=(0.0, 0.0, 1.0, 1.0), dt=dt) / m
+            acc += [push / m, -g]
+            vel += acc * dt
+            pos += vel * dt
+        return pos[0, 0], vel[0, 0]
+
+    def test_sliding_friction(self):
+        model = LinearSpringDashpot(1e3, restitution=0.5, friction_static=0.5, friction_dynamic=0.4)
+        _, vx = self.slide(model, 1.0)
+        # Liukuva rae hidastuu kitkalla mu_d g
+        self.assertAlmostEqual((1.0 - vx) / 0.05, 0.4 * 9.81, delta=0.02)
+        _, vx = self.slide(LinearSpringDashpot(1e3, restitution=0.5), 1.0)
+        self.assertAlmostEqual(vx, 1.0)
+
+    def test_spring_rotates_with_the_contact(self):
+        engine = ContactEngine(LinearSpringDashpot(1e3, friction_static=0.5), 0.01, 0.01)
+        keys = np.array([1])
+        engine.pair_history.update(keys)
+        engine.pair_history.store(np.array([[0.0, 1e-4]]))
+        # Normaali kääntyy 45 astetta: jousi käännetään tangenttitasoon, pituus säilyy
+        normal = np.array([[np.sqrt(0.5), np.sqrt(0.5)]])
+        engine.tangential_forces(engine.pair_history, keys, np.array([1e-3]), normal, np.zeros((1, 2)),
+                                 np.array([10.0]), np.array([0.005]), np.array([0.005]), dt=0.0)
+        delta = engine.pair_history.values[0]
+        self.assertAlmostEqual(np.linalg.norm(delta), 1e-4)
+        self.assertAlmostEqual(float(delta @ normal[0]), 0.0)
+
+    def test_static_friction(self):
+        model = LinearSpringDashpot(1e3, restitution=0.5, friction_static=0.5, friction_dynamic=0.4)
+        # Push below mu_s m g: the grain sticks; above it: slides
+        x, vx = self.slide(model, 0.0, push=0.3 * 0.01 * 9.81)
+        self.assertLess(abs(x - 0.5), 1e-3)
+        self.assertLess(abs(vx), 1e-2)
+        # Once the spring has loaded up to the Coulomb limit the acceleration is (0.6 - mu_d) g
+        _, v1 = self.slide(model, 0.0, push=0.6 * 0.01 * 9.81, steps=2500)
+        _, v2 = self.slide(model, 0.0, push=0.6 * 0.01 * 9.81)
+        self.assertAlmostEqual((v2 - v1) / 0.025, 0.2 * 9.81, delta=0.01)
+
+
+class TestSimulationContacts(unittest.TestCase):
+    params = dict(BASE_PARAMS, steps=20, fill_frac=0.8)
+
+    def test_grains_collide(self):
+        for model in ('linear', HertzMindlin(1e6, restitution=0.4)):
+            random.seed(5)
+            sim = Simulaatio(dem_contact_model=model, dem_substeps='auto', **self.params)
+            result = sim.aja()
+            self.assertTrue(np.all(np.isfinite(result['ship_y_hist'])))
+            d = sim.damperi
+            # Seinät pitävät rakeet sisällä kontaktivoimalla (pieni päällekkäisyys sallitaan)
+            self.assertTrue(np.all(d.dem_pos[:, 0] >= d.x + 0.5 * d.dem_r))
+            self.assertTrue(np.all(d.dem_pos[:, 1] <= d.y + d.height - 0.5 * d.dem_r))
+        self.assertGreater(sim.dem_engine.n_contacts + sim.dem_engine.n_wall_contacts, 0)
+
+    def test_grains_settle_on_floor(self):
+        random.seed(5)
+        params = dict(self.params, dt=5e-4, steps=1000)
+        sim = Simulaatio(dem_contact_model='linear', dem_substeps='auto', **params)
+        kin = np.asarray(sim.aja()['damper_kin_energy_hist'])
+        d = sim.damperi
+        # Seinäjousi ja -vaimennin toimivat: rakeet lepäävät pohjalla ja liike-energia vaimenee
+        self.assertGreater(sim.dem_engine.n_wall_contacts, 0)
+        self.assertLess(kin[-100:].max(), 0.01 * kin.max())
+        self.assertLess(kin[-100:].mean(), kin[-300:-200].mean())
+        self.assertLess(np.abs(d.dem_vel).max(), 1.0)
+        self.assertLess(np.min(d.dem_pos[:, 1] - d.y), d.dem_r)
+
+if __name__ == "__main__":
+    unittest.main()
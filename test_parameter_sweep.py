@@ -0,0 +1,263 @@
+"""
+Unit tests for the parameter sweep engine (analysis/parameter_sweep.py)
+"""
+import os
+import sys
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from analysis.journal import ResultJournal
+from analysis.orchestrator import CaseFailed, Orchestrator
+from analysis.parameter_sweep import apply_overrides, expand_grid, parse_grid, run_sweep
+from analysis.result_cache import ResultCache, cache_key
+from analysis.verification import VerificationStudy, observed_order, richardson_extrapolate
+
+BASE = {'dem': {'n_particles': 30, 'particle_size_m': 0.008}, 'fluid': {'mu': 8.9e-4}}
+
+
+def square_case(case):
+    # Palauttaa myös työprosessin BLAS-säieasetuksen
+    n = case['params']['dem.n_particles']
+    return dict(case=case['case'], n=n, n2=n * n, threads=os.environ.get('OMP_NUM_THREADS'))
+
+
+def failing_case(case):
+    if case['params']['dem.n_particles'] == 1:
+        raise RuntimeError("boom")
+    return square_case(case)
+
+
+def model_point(h, dt, c=1.0):
+    # Tunnettu ratkaisu 1 + c h^2 + dt
+    return dict(f=1.0 + c * h**2 + dt, pid=os.getpid())
+
+
+class TestParameterSweep(unittest.TestCase):
+    def test_expand_grid(self):
+        cases = expand_grid(BASE, {'dem.n_particles': [0, 60], 'fluid.mu': [1e-3, 2e-3]},
+                            keep=lambda p: p['fluid.mu'] < 2e-3 or p['dem.n_particles'] == 0)
+        self.assertEqual([c['case'] for c in cases], ['n_particles0_mu0.001', 'n_particles0_mu0.002',
+                                                      'n_particles60_mu0.001'])
+        self.assertEqual(cases[2]['config']['dem'], {'n_particles': 60, 'particle_size_m': 0.008})
+        self.assertEqual(BASE['dem']['n_particles'], 30)
+
+    def test_apply_overrides_creates_sections(self):
+        cfg = apply_overrides(BASE, {'output.directory': 'x'})
+        self.assertEqual(cfg['output'], {'directory': 'x'})
+
+    def test_parse_grid(self):
+        self.assertEqual(parse_grid(['dem.n_particles=0,30', 'fluid.mu=1e-3', 'fluid.name=water']),
+                         {'dem.n_particles': [0, 30], 'fluid.mu': [1e-3], 'fluid.name': ['water']})
+
+    def test_run_sweep_streams_rows(self):
+        cases = expand_grid(BASE, {'dem.n_particles': [0, 1, 2, 3]})
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'metrics.csv')
+            df = run_sweep(cases, failing_case, workers=2, metrics_path=path)
+            self.assertEqual(sorted(df['n2']), [0, 4, 9])
+            self.assertEqual(sorted(pd.read_csv(path)['n']), [0, 2, 3])
+            self.assertTrue((df['threads'] == '1').all())
+
+class TestResultCache(unittest.TestCase):
+    def test_key_depends_on_inputs_only(self):
+        a = {'dem': {'n': 1, 'd': 2.0}, 'fluid': {'mu': 1e-3}}
+        b = {'fluid': {'mu': 1e-3}, 'dem': {'d': 2.0, 'n': 1}}
+        self.assertEqual(cache_key(a, 'v1', 0), cache_key(b, 'v1', 0))
+        self.assertNotEqual(cache_key(a, 'v1', 0), cache_key(a, 'v2', 0))
+        self.assertNotEqual(cache_key(a, 'v1', 0), cache_key(a, 'v1', 1))
+
+    def test_run_and_metrics_roundtrip(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = ResultCache(os.path.join(tmp, 'cache'))
+            run = os.path.join(tmp, 'run')
+            os.makedirs(run)
+            with open(os.path.join(run, 'out.txt'), 'w') as f:
+                f.write('data')
+            key = cache_key({'x': 1})
+            self.assertIsNone(cache.restore_run(key, os.path.join(tmp, 'restored')))
+            self.assertIsNone(cache.get_metrics(key))
+            cache.store_run(key, run)
+            cache.put_metrics(key, {'f': np.float64(4.2), 'n': np.int64(3), 'delta': float('nan')})
+            restored = cache.restore_run(key, os.path.join(tmp, 'restored'))
+            with open(os.path.join(restored, 'out.txt')) as f:
+                self.assertEqual(f.read(), 'data')
+            metrics = cache.get_metrics(key)
+            self.assertEqual((metrics['f'], metrics['n']), (4.2, 3))
+            self.assertTrue(np.isnan(metrics['delta']))
+
+    def test_oversized_entry_survives_its_store(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = ResultCache(os.path.join(tmp, 'cache'), max_bytes=500)
+            run = os.path.join(tmp, 'run')
+            os.makedirs(run)
+            with open(os.path.join(run, 'out.txt'), 'w') as f:
+                f.write('x' * 2000)
+            old, key = cache_key({'x': 0}), cache_key({'x': 1})
+            cache.put_metrics(old, {'f': 1.0})
+            cache.store_run(key, run)
+            self.assertIsNotNone(cache.restore_run(key, os.path.join(tmp, 'restored')))
+            self.assertIsNone(cache.get_metrics(old))    # older entries still make room
+
+    def test_lru_eviction(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = ResultCache(tmp, max_bytes=2500)
+            keys = [cache_key({'case': k}) for k in range(3)]
+            for n, key in enumerate(keys[:2]):
+                cache.put_metrics(key, {'pad': 'x' * 1000})
+                os.utime(cache._entry(key), (n, n))
+            cache.get_metrics(keys[0])            # keys[0] is now the most recently used
+            cache.put_metrics(keys[2], {'pad': 'x' * 1000})
+            self.assertIsNotNone(cache.get_metrics(keys[0]))
+            self.assertIsNone(cache.get_metrics(keys[1]))
+            self.assertIsNotNone(cache.get_metrics(keys[2]))
+
+
+class TestResultJournal(unittest.TestCase):
+    def test_append_resume_and_consolidate(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            journal = ResultJournal(os.path.join(tmp, 'metrics.jsonl'))
+            journal.append({'case': 'a', 'n': np.int64(1), 'f': np.float64(2.5)})
+            journal.append({'case': 'b', 'n': 2, 'f': float('nan')})
+            # Keskeytynyt kirjoitus jättää puolikkaan rivin
+            with open(journal.path, 'a') as f:
+                f.write('{"case": "c", "n"')
+            journal = ResultJournal(journal.path)
+            self.assertEqual(journal.completed(), {'a', 'b'})
+            journal.append({'case': 'a', 'n': 3, 'f': 1.0})
+            df = journal.consolidate(os.path.join(tmp, 'metrics.csv'))
+            self.assertEqual(list(df['case']), ['b', 'a'])
+            self.assertEqual(list(df['n']), [2, 3])
+            self.assertTrue(np.isnan(df['f'][0]))
+            self.assertEqual(len(pd.read_csv(os.path.join(tmp, 'metrics.csv'))), 2)
+            journal.reset()
+            self.assertEqual(journal.completed(), set())
+
+    def test_run_sweep_journals_rows(self):
+        cases = expand_grid(BASE, {'dem.n_particles': [0, 1, 2]})
+        with tempfile.TemporaryDirectory() as tmp:
+            journal = ResultJournal(os.path.join(tmp, 'metrics.jsonl'))
+            run_sweep(cases, failing_case, workers=2, journal=journal)
+            self.assertEqual(journal.completed(), {'n_particles0', 'n_particles2'})
+
+
+def python_job(case, out_dir, code):
+    return dict(case=case, out_dir=out_dir, command=[sys.executable, '-c', code])
+
+
+def read_value(out_dir):
+    return dict(value=float((Path(out_dir) / 'value.txt').read_text()))
+
+
+class TestOrchestrator(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.root = Path(self.tmp.name)
+
+    def writer_job(self, case, value):
+        out_dir = self.root / case
+        code = f"print('solving {case}'); open(r'{out_dir / 'value.txt'}', 'w').write('{value}')"
+        return python_job(case, out_dir, code)
+
+    def test_runs_jobs_concurrently(self):
+        # Each job waits (up to 10 s) until all four have started, then records its start and end time
+        jobs = []
+        for i in range(4):
+            out_dir = self.root / f"c{i}"
+            code = (f"import glob, time; start = time.time(); print('solving c{i}')\n"
+                    f"open(r'{self.root / f'c{i}.started'}', 'w').close()\n"
+                    f"while len(glob.glob(r'{self.root / '*.started'}')) < 4 and time.time() - start < 10: "
+                    f"time.sleep(0.01)\n"
+                    f"open(r'{out_dir / 'interval.txt'}', 'w').write(f'{{start}} {{time.time()}}')\n"
+                    f"open(r'{out_dir / 'value.txt'}', 'w').write('{i}')")
+            jobs.append(python_job(f"c{i}", out_dir, code))
+        seen = []
+        rows = Orchestrator(concurrency=4).run(jobs, read_value, on_result=lambda row, info: seen.append(row))
+        intervals = [np.loadtxt(self.root / f"c{i}" / 'interval.txt') for i in range(4)]
+        self.assertLess(max(start for start, _ in intervals), min(end for _, end in intervals))
+        self.assertEqual(sorted(r['value'] for r in rows), [0.0, 1.0, 2.0, 3.0])
+        self.assertEqual(len(seen), 4)
+        self.assertIn("solving c2", (self.root / 'c2' / 'solver.log').read_text())
+
+    def test_retry_after_failure(self):
+        out_dir = self.root / 'flaky'
+        marker = out_dir / 'tried'
+        code = (f"import os, sys; p = r'{marker}'\n"
+                f"if not os.path.exists(p): open(p, 'w').close(); sys.exit(3)\n"
+                f"open(r'{out_dir / 'value.txt'}', 'w').write('7')")
+        infos = []
+        rows = Orchestrator(retries=1, backoff=0.0).run([python_job('flaky', out_dir, code)], read_value,
+                                                        on_result=lambda row, info: infos.append(info))
+        self.assertEqual(rows[0]['value'], 7.0)
+        self.assertEqual(infos[0]['attempts'], 2)
+        self.assertIn("exit code 3", (out_dir / 'solver.log').read_text())
+
+    def test_timeout_kills_and_reports(self):
+        jobs = [python_job('slow', self.root / 'slow', "import time; time.sleep(30)"), self.writer_job('fast', 1)]
+        failures = []
+        t0 = time.perf_counter()
+        rows = Orchestrator(concurrency=2, timeout=0.5, retries=1, backoff=0.0).run(
+            jobs, read_value, on_failure=failures.append)
+        self.assertLess(time.perf_counter() - t0, 10.0)
+        self.assertEqual([r['case'] for r in rows], ['fast'])
+        self.assertEqual(len(failures), 1)
+        self.assertIsInstance(failures[0], CaseFailed)
+        self.assertEqual(failures[0].case, 'slow')
+        self.assertEqual((self.root / 'slow' / 'solver.log').read_text().count("timed out"), 2)
+
+    def test_parse_error_is_a_case_failure(self):
+        failures = []
+        rows = Orchestrator().run([python_job('empty', self.root / 'empty', "pass")], read_value,
+                                  on_failure=failures.append)
+        self.assertEqual(rows, [])
+        self.assertIn("parsing failed", str(failures[0]))
+
+    def test_missing_solver_is_a_case_failure(self):
+        missing = dict(case='missing', command=[str(self.root / 'no-such-solver')], out_dir=self.root / 'missing')
+        failures = []
+        rows = Orchestrator(retries=1, backoff=0.0).run([missing, self.writer_job('ok', 2)], read_value,
+                                                        on_failure=failures.append)
+        self.assertEqual([r['case'] for r in rows], ['ok'])
+        self.assertEqual(failures[0].case, 'missing')
+        self.assertEqual((self.root / 'missing' / 'solver.log').read_text().count("could not run solver"), 2)
+
+
+class TestVerification(unittest.TestCase):
+    def test_observed_order_and_extrapolation(self):
+        h = np.array([0.4, 0.2, 0.1])
+        f = 3.0 + 0.5 * h**2
+        p = observed_order(*f, r21=2.0)
+        self.assertAlmostEqual(p, 2.0)
+        self.assertAlmostEqual(richardson_extrapolate(f[2], f[1], 2.0, p), 3.0)
+        # Vaihteleva tihennyssuhde
+        h = np.array([0.3, 0.2, 0.1])
+        f = 3.0 + 0.5 * h**1.5
+        self.assertAlmostEqual(observed_order(*f, r21=2.0, r32=1.5), 1.5, places=6)
+        self.assertTrue(np.isnan(observed_order(1.0, 1.0, 1.0, 2.0)))
+
+    def test_study_dedupes_and_memoizes(self):
+        study = VerificationStudy(model_point, dict(h=0.1, dt=0.0, c=1.0), workers=2)
+        study.add('h', [0.4, 0.2, 0.1])
+        study.add('dt', [0.0, 0.01], name='time')
+        study.add('c', [1.0, 2.0], h=0.2)
+        self.assertEqual(len(study.pending()), 5)
+        self.assertEqual(study.run(), 5)
+        self.assertEqual(study.run(), 0)
+        self.assertEqual(study.result(h=0.2, c=2.0)['f'], 1.08)
+        self.assertEqual(study.runs, 5)
+        table = study.convergence('h', 'f', exact=1.0)
+        self.assertEqual(list(table['value']), [0.4, 0.2, 0.1])
+        self.assertAlmostEqual(table['order'].iloc[-1], 2.0)
+        self.assertAlmostEqual(table['extrapolated'].iloc[-1], 1.0)
+        self.assertAlmostEqual(table['error_order'].iloc[-1], 2.0)
+        values = [v for v, _ in study.sweep('time')]
+        self.assertEqual(values, [0.0, 0.01])
+        self.assertEqual(study.runs, 5)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,9 +1,18 @@
 """
 Unit tests for SPH-DEM ship simulation (sph_2d_example.py)
 """
+import os
+import random
+import tempfile
 import unittest
 import numpy as np
-from sph_2d_example import Simulaatio, compute_buoyancy, compute_damper_reaction
+from sph_2d_example import Ensemble, Simulaatio, compute_buoyancy, compute_damper_reaction, precision_energy_deviation
+from sph.snapshots import SnapshotReader
+from sph.timestep import contact_period, stable_time_step, time_options_from_config
+
+# Small, calm setup shared by the simulation tests; tests override the steps and options
+BASE_PARAMS = dict(N=100, L=1.0, h=0.08, m=0.02, rho0=2.5, k=1.0, mu=0.1, G=np.array([0, -9.81]),
+                   dt=0.001, steps=10, fill_frac=0.4)
 
 class TestSimulationUtils(unittest.TestCase):
     def test_buoyancy_zero(self):
@@ -34,5 +43,306 @@ class TestSimulationRun(unittest.TestCase):
         self.assertEqual(len(result['ship_y_hist']), 5)
         self.assertEqual(len(result['damper_kin_energy_hist']), 5)
 
+    def test_verlet_skin_matches_fresh_search(self):
+        # Calm setup (rho0 close to the initial density): particles move far less than skin/2
+        results = []
+        for skin in (0.0, 0.02):
+            random.seed(3)
+            sim = Simulaatio(skin=skin, **BASE_PARAMS)
+            results.append(sim.aja())
+        np.testing.assert_array_equal(results[0]['ship_y_hist'], results[1]['ship_y_hist'])
+        self.assertEqual(results[0]['neighbor_rebuilds'], 10)
+        self.assertEqual(results[1]['neighbor_rebuilds'], 1)
+        self.assertGreater(results[1]['neighbor_time_per_step'], 0.0)
+
+    def test_dem_coupling_matches_per_grain_scan(self):
+        random.seed(2)
+        sim = Simulaatio(N=400, L=1.0, h=0.05, m=0.005, rho0=2.5, k=1.0, mu=0.1,
+                         G=np.array([0, -9.81]), dt=0.001, steps=3, fill_frac=0.8)
+        react = sim.dem_react_forces
+        sim.aja()
+        self.assertIs(sim.dem_react_forces, react)
+        sim.sph_kiihtyvyys()
+        d = sim.damperi
+        expected = np.zeros((sim.DEM_N, 2))
+        for g in range(sim.DEM_N):
+            near = np.linalg.norm(sim.pos - d.dem_pos[g], axis=1) < sim.neighbor_search.radius
+            force = -0.5 * sim.k * np.stack([np.zeros(near.sum()), sim.pos[near, 1] - d.dem_pos[g, 1]], axis=1)
+            expected[g] = -np.sum(force - 0.1 * (sim.vel[near] - d.dem_vel[g]), axis=0)
+        self.assertGreater(np.count_nonzero(expected[:, 0]), 0)
+        np.testing.assert_allclose(react, expected, rtol=1e-12, atol=1e-12)
+
+    def test_dem_coupling_reuses_pair_list_grid(self):
+        # Kytkentä ei rakenna nesteen ruudukkoa uudelleen: yksi binnaus askeleessa, Verlet-listalla vain yksi
+        for skin, bins in ((0.0, 10), (0.02, 1)):
+            random.seed(3)
+            sim = Simulaatio(skin=skin, neighbor_search='hash', **BASE_PARAMS)
+            grid = sim.neighbor_search.search if skin else sim.neighbor_search
+            calls = []
+            binned = grid._bin
+            grid._bin = lambda cells: calls.append(1) or binned(cells)
+            sim.aja()
+            self.assertEqual(len(calls), bins)
+
+
+class TestAdaptiveTimeStep(unittest.TestCase):
+    def test_adaptive_run_reaches_end_time(self):
+        random.seed(4)
+        sim = Simulaatio(**dict(BASE_PARAMS, steps=0, t_end=0.05, adaptive=True, output_interval=0.01))
+        result = sim.aja()
+        self.assertAlmostEqual(sim.t, 0.05)
+        self.assertAlmostEqual(sum(result['dt_hist']), 0.05)
+        self.assertEqual(len(result['ship_y_hist']), 5)
+        np.testing.assert_allclose(result['t'], [0.01, 0.02, 0.03, 0.04, 0.05])
+        # DEM contact stiffness limits the step in this calm setup
+        self.assertLessEqual(max(result['dt_hist']), contact_period(0.01, 5000) / 20 * (1 + 1e-12))
+
+    def test_force_criterion_includes_dem_coupling(self):
+        random.seed(4)
+        sim = Simulaatio(**dict(BASE_PARAMS, steps=0))
+        acc, _ = sim.sph_kiihtyvyys()
+        self.assertTrue(np.any(sim.dem_react_forces))
+        self.assertEqual(sim.a_max, np.sqrt(np.max(np.sum(acc**2, axis=1))))
+
+    def test_stable_time_step_criteria(self):
+        dt, criteria = stable_time_step(h=0.1, c=10.0, v_max=0.0, a_max=100.0, nu=0.01, cfl=0.5)
+        self.assertAlmostEqual(criteria['cfl'], 0.005)
+        self.assertAlmostEqual(criteria['viscous'], 0.125)
+        self.assertAlmostEqual(criteria['force'], 0.25 * np.sqrt(0.001))
+        self.assertEqual(dt, min(criteria.values()))
+
+    def test_time_options_from_config(self):
+        cfg = {'simulation': {'time': {'t_end': 5.0, 'output_interval': 0.001, 'CFL': 0.7, 'time_step_mode': 'auto'}},
+               'integration': {'max_time_step': '1e-4', 'min_time_step': '1e-6', 'scheme': 'leapfrog'}}
+        self.assertEqual(time_options_from_config(cfg), {'adaptive': True, 't_end': 5.0, 'output_interval': 0.001,
+                                                         'cfl': 0.7, 'dt_min': 1e-6, 'dt_max': 1e-4,
+                                                         'integrator': 'leapfrog'})
+
+
+class TestDemSubcycling(unittest.TestCase):
+    def make(self, **kwargs):
+        random.seed(6)
+        return Simulaatio(**dict(BASE_PARAMS, steps=5, **kwargs))
+
+    def test_auto_substeps_from_contact_period(self):
+        sim = self.make(dem_substeps='auto')
+        n = int(np.ceil(0.001 / (contact_period(0.01, 5000) / 20)))
+        self.assertEqual(sim.dem_alisteps(), n)
+        result = sim.aja()
+        self.assertEqual(result['dem_substeps_taken'], 5 * n)
+
+    def test_adaptive_fluid_step_not_dem_limited(self):
+        for coupling in ('hold', 'interpolate'):
+            sim = self.make(dem_substeps='auto', dem_coupling=coupling, t_end=0.02, adaptive=True)
+            result = sim.aja()
+            self.assertGreater(max(result['dt_hist']), contact_period(0.01, 5000) / 20)
+            self.assertGreater(result['dem_substeps_taken'], result['steps_taken'])
+            self.assertTrue(np.all(np.isfinite(sim.damperi.dem_pos)))
+
+
+class TestIntegrators(unittest.TestCase):
+    def test_second_order_schemes_run(self):
+        for scheme in ('leapfrog', 'verlet', 'predictor_corrector'):
+            random.seed(7)
+            sim = Simulaatio(**dict(BASE_PARAMS, dt=0.002, integrator=scheme))
+            result = sim.aja()
+            self.assertEqual(len(result['kin']), 10)
+            self.assertTrue(np.all(np.isfinite(result['kin'])), scheme)
+            self.assertTrue(np.all(np.isfinite(sim.damperi.dem_pos)), scheme)
+
+    def test_second_order_schemes_closer_to_reference(self):
+        # Same dt: leapfrog and Verlet land closer to the fine-step solution than Euler
+        def run(scheme, n):
+            random.seed(7)
+            sim = Simulaatio(**dict(BASE_PARAMS, dt=0.02 / n, steps=n, integrator=scheme))
+            sim.aja()
+            return sim
+        ref = run('verlet', 160)
+        errors = {}
+        for scheme in ('euler', 'leapfrog', 'verlet'):
+            sim = run(scheme, 10)
+            errors[scheme] = max(np.max(np.abs(sim.pos - ref.pos)), abs(sim.damperi.y - ref.damperi.y))
+        self.assertLess(errors['leapfrog'], 0.1 * errors['euler'])
+        self.assertLess(errors['verlet'], 0.1 * errors['euler'])
+
+    def test_one_force_evaluation_per_step(self):
+        # Leapfrog and Verlet reuse the end-of-step forces, which already see the sub-stepped grains
+        for scheme, calls in (('euler', 10), ('leapfrog', 11), ('verlet', 11), ('predictor_corrector', 20)):
+            random.seed(7)
+            sim = Simulaatio(**dict(BASE_PARAMS, dt=0.002, integrator=scheme, dem_substeps=4))
+            counted = []
+            forces = sim.sph_kiihtyvyys
+            sim.sph_kiihtyvyys = lambda: counted.append(sim.dem_substeps_taken) or forces()
+            sim.aja()
+            self.assertEqual(len(counted), calls, scheme)
+            if scheme in ('leapfrog', 'verlet'):
+                self.assertEqual(counted[1:], list(range(4, 44, 4)), scheme)
+
+    def test_unknown_integrator(self):
+        with self.assertRaises(ValueError):
+            Simulaatio(N=16, L=1.0, h=0.1, m=0.02, rho0=2.5, k=1.0, mu=0.1, G=np.array([0, -9.81]),
+                       dt=0.001, steps=1, fill_frac=0.2, integrator='rk4')
+
+
+class TestPrecision(unittest.TestCase):
+    params = BASE_PARAMS
+
+    def test_float32_storage(self):
+        random.seed(8)
+        sim = Simulaatio(dtype=np.float32, **self.params)
+        sim.aja()
+        self.assertEqual(sim.pos.dtype, np.float32)
+        self.assertEqual(sim.fluid.rho.dtype, np.float32)
+        self.assertEqual(sim.damperi.dem_pos.dtype, np.float32)
+
+    def test_energy_deviation_against_float64(self):
+        self.assertLess(precision_energy_deviation(seed=8, **self.params), 1e-4)
+
+
+class TestTelemetry(unittest.TestCase):
+    def test_decimated_spilled_histories(self):
+        params = dict(BASE_PARAMS, steps=12)
+        random.seed(9)
+        full = Simulaatio(**params).aja()
+        with tempfile.TemporaryDirectory() as tmp:
+            random.seed(9)
+            result = Simulaatio(telemetry_decimate={'kin': 3}, telemetry_dir=tmp, **params).aja()
+            self.assertIsInstance(result['kin'], np.memmap)
+            np.testing.assert_array_equal(result['kin'], full['kin'][::3])
+            np.testing.assert_array_equal(result['ship_y_hist'], full['ship_y_hist'])
+            self.assertEqual(result['steps_taken'], 12)
+            del result
+
+
+class TestSnapshotOutput(unittest.TestCase):
+    def test_snapshots_at_output_interval(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            random.seed(11)
+            sim = Simulaatio(snapshot_dir=tmp, snapshot_interval=0.002, **BASE_PARAMS)
+            sim.aja()
+            reader = SnapshotReader(tmp)
+            np.testing.assert_allclose(reader.times, 0.002 * np.arange(1, 6))
+            np.testing.assert_array_equal(reader.field('x', 4), sim.pos)
+            np.testing.assert_array_equal(reader.field('p', 4), sim.fluid.p)
+
+
+class TestEnsemble(unittest.TestCase):
+    def make(self, fill_frac, mu, k, **kwargs):
+        random.seed(int(10 * fill_frac))
+        return Simulaatio(**dict(BASE_PARAMS, k=k, mu=mu, steps=8, fill_frac=fill_frac, neighbor_search='brute',
+                                 **kwargs))
+
+    def test_matches_individual_runs(self):
+        cases = [(0.2, 0.1, 1.0), (0.4, 0.3, 2.0), (0.8, 0.1, 0.5), (0.0, 0.1, 1.0)]
+        single = [self.make(*case).aja() for case in cases]
+        batch = Ensemble([self.make(*case) for case in cases], neighbor_search='hash').aja()
+        for a, b in zip(single, batch):
+            self.assertEqual(a['fill_frac'], b['fill_frac'])
+            for key in ('ship_y_hist', 'damper_kin_energy_hist', 'kin', 'pot', 'diss', 't'):
+                np.testing.assert_allclose(b[key], a[key], rtol=1e-12, atol=1e-14)
+
+    def test_rejects_unsupported_members(self):
+        with self.assertRaises(ValueError):
+            Ensemble([self.make(0.2, 0.1, 1.0), self.make(0.2, 0.1, 1.0, integrator='leapfrog')])
+        with tempfile.TemporaryDirectory() as tmp:
+            for option in (dict(skin=0.02), dict(telemetry_decimate=2), dict(telemetry_dir=tmp),
+                           dict(checkpoint_path=os.path.join(tmp, 'c.pkl')), dict(snapshot_dir=tmp),
+                           dict(output_interval=0.002), dict(domain_workers=2), dict(dem_contact_model='linear')):
+                with self.assertRaisesRegex(ValueError, next(iter(option))):
+                    Ensemble([self.make(0.2, 0.1, 1.0), self.make(0.2, 0.1, 1.0, **option)])
+
+
+class TestCheckpoint(unittest.TestCase):
+    params = dict(BASE_PARAMS, skin=0.02, integrator='leapfrog')
+
+    def test_restart_is_bit_identical(self):
+        random.seed(10)
+        full = Simulaatio(**self.params).aja()
+        with tempfile.TemporaryDirectory() as tmp:
+            random.seed(10)
+            path = os.path.join(tmp, 'ck_{step}.pkl')
+            Simulaatio(checkpoint_path=path, checkpoint_interval=4, **self.params).aja()
+            self.assertEqual(sorted(os.listdir(tmp)), ['ck_4.pkl', 'ck_8.pkl'])
+            restarted = Simulaatio.lataa(path.format(step=4)).aja()
+        for key in ('ship_y_hist', 'kin', 'pot', 'diss', 't'):
+            np.testing.assert_array_equal(restarted[key], full[key])
+
+    def test_branch_with_changed_parameter(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            random.seed(10)
+            path = os.path.join(tmp, 'spinup.pkl')
+            sim = Simulaatio(**dict(self.params, steps=4))
+            sim.aja()
+            sim.tallenna(path)
+            branch = Simulaatio.lataa(path, mu=0.5, steps=6).aja()
+            self.assertEqual(branch['steps_taken'], 6)
+            with self.assertRaises(AttributeError):
+                Simulaatio.lataa(path, viscosity=0.5)
+
+    def test_loading_checkpoint_keeps_snapshots(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            random.seed(10)
+            run, path = os.path.join(tmp, 'run'), os.path.join(tmp, 'spinup.pkl')
+            sim = Simulaatio(snapshot_dir=run, **dict(self.params, steps=4))
+            sim.aja()
+            sim.tallenna(path)
+            sim.steps = 8
+            sim.aja()
+            times = np.array(SnapshotReader(run).times)
+            # Sama tarkistuspiste kahdesti: tiedostot ennallaan, haarat omiin hakemistoihinsa
+            branches = [Simulaatio.lataa(path, mu=mu, steps=8, snapshot_dir=os.path.join(tmp, f'mu{mu}'))
+                        for mu in (0.2, 0.5)]
+            np.testing.assert_array_equal(SnapshotReader(run).times, times)
+            for branch in branches:
+                branch.aja()
+            a, b = (SnapshotReader(os.path.join(tmp, f'mu{mu}')) for mu in (0.2, 0.5))
+            np.testing.assert_array_equal(a.times, times)
+            np.testing.assert_array_equal(a.field('x', 3), b.field('x', 3))
+            self.assertFalse(np.array_equal(a.field('x', 7), b.field('x', 7)))
+            np.testing.assert_array_equal(SnapshotReader(run).times, times)
+
+    def test_branch_keeps_spilled_telemetry(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            random.seed(10)
+            run, path = os.path.join(tmp, 'run'), os.path.join(tmp, 'ck_{step}.pkl')
+            result = Simulaatio(telemetry_dir=run, checkpoint_path=path, checkpoint_interval=5, **self.params).aja()
+            kin = np.array(result['kin'])
+            with self.assertRaisesRegex(ValueError, 'telemetry_dir'):
+                Simulaatio.lataa(path.format(step=5), mu=5.0)
+            branch = Simulaatio.lataa(path.format(step=5), mu=5.0, telemetry_dir=os.path.join(tmp, 'branch')).aja()
+            np.testing.assert_array_equal(result['kin'], kin)
+            np.testing.assert_array_equal(branch['kin'][:5], kin[:5])
+            self.assertFalse(np.array_equal(branch['kin'][5:], kin[5:]))
+            del result, branch
+
+
+class TestDomainDecomposition(unittest.TestCase):
+    params = dict(N=400, L=1.0, h=0.05, m=0.02, rho0=2.5, k=1.0, mu=0.1, G=np.array([0, -9.81]),
+                  dt=0.001, steps=8, fill_frac=0.4, neighbor_search='grid')
+
+    def test_matches_serial_run(self):
+        random.seed(12)
+        serial = Simulaatio(**self.params).aja()
+        random.seed(12)
+        sim = Simulaatio(domain_workers=2, **self.params)
+        parallel = sim.aja()
+        for key in ('ship_y_hist', 'kin', 'pot', 'diss'):
+            np.testing.assert_array_equal(parallel[key], serial[key])
+        self.assertIsNone(sim.fluid.allocator)   # particle arrays back in private memory after aja()
+
+    def test_checkpoint_restart(self):
+        random.seed(12)
+        full = Simulaatio(**self.params).aja()
+        with tempfile.TemporaryDirectory() as tmp:
+            random.seed(12)
+            path = os.path.join(tmp, 'ck_{step}.pkl')
+            Simulaatio(domain_workers=2, checkpoint_path=path, checkpoint_interval=4, **self.params).aja()
+            restarted = Simulaatio.lataa(path.format(step=4)).aja()
+        np.testing.assert_array_equal(restarted['ship_y_hist'], full['ship_y_hist'])
+
+    def test_needs_numpy_full_pairs(self):
+        with self.assertRaises(ValueError):
+            Simulaatio(domain_workers=2, pair_mode='half', **self.params)
+
 if __name__ == "__main__":
     unittest.main()
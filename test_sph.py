@@ -0,0 +1,472 @@
+"""
+Unit tests for the SPH building blocks (sph package)
+"""
+import os
+import pickle
+import random
+import tempfile
+import unittest
+import numpy as np
+from sph import integrators, numba_engine
+from sph.domain import SharedArrays, StripDecomposition
+from sph.kernels import KERNELS, cubic_spline_grad, cubic_spline_w, get_kernel
+from sph.neighbors import BACKENDS, CellList, HashedCellList, VerletList, make_neighbor_search, select_backend
+from sph.particles import PHASE_DEM, PHASE_FLUID, ParticleSet
+from sph.snapshots import SnapshotReader, SnapshotWriter, snapshot_fields_from_config
+from sph.telemetry import TelemetryRecorder
+from sph.operators import (density, density_half, half_pairs, pair_geometry, pressure_acceleration,
+                           pressure_acceleration_half, viscous_acceleration, viscous_acceleration_half)
+
+
+def brute_force_pairs(points, pos, radius):
+    d = np.linalg.norm(pos[None, :, :] - points[:, None, :], axis=-1)
+    return np.nonzero(d < radius)
+
+
+class TestNeighborSearch(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.pos = rng.uniform(0.0, 1.0, size=(300, 2))
+        self.radius = 0.16
+
+    def assertSamePairs(self, got, expected):
+        np.testing.assert_array_equal(got[0], expected[0])
+        np.testing.assert_array_equal(got[1], expected[1])
+
+    def test_cell_list_matches_brute_force(self):
+        search = CellList(self.radius, 1.0)
+        self.assertSamePairs(search.pairs(self.pos), brute_force_pairs(self.pos, self.pos, self.radius))
+
+    def test_hashed_matches_brute_force_outside_box(self):
+        pos = self.pos.copy()
+        pos[:20] += np.array([3.0, -2.5])  # splash far outside the L x L box
+        expected = brute_force_pairs(pos, pos, self.radius)
+        self.assertSamePairs(HashedCellList(self.radius).pairs(pos), expected)
+        # the dense grid clamps outside points to the border and stays exact
+        self.assertSamePairs(CellList(self.radius, 1.0).pairs(pos), expected)
+
+    def test_query_points(self):
+        points = np.array([[0.5, 0.5], [0.0, 0.0], [2.0, 2.0]])
+        expected = brute_force_pairs(points, self.pos, self.radius)
+        self.assertSamePairs(CellList(self.radius, 1.0).query(points, self.pos), expected)
+        self.assertSamePairs(HashedCellList(self.radius).query(points, self.pos), expected)
+
+    def test_all_backends_agree(self):
+        expected = brute_force_pairs(self.pos, self.pos, self.radius)
+        points = self.pos[:7] + 0.01
+        expected_query = brute_force_pairs(points, self.pos, self.radius)
+        for kind in BACKENDS:
+            search = make_neighbor_search(kind, self.radius, L=1.0)
+            self.assertSamePairs(search.pairs(self.pos), expected)
+            self.assertSamePairs(search.query(points, self.pos), expected_query)
+            self.assertEqual(search.stats()['builds'], 1)
+
+    def test_auto_selection(self):
+        name, timings = select_backend(self.pos, self.radius, L=1.0)
+        self.assertIn(name, BACKENDS)
+        self.assertEqual(min(timings, key=timings.get), name)
+        search = make_neighbor_search('auto', self.radius, L=1.0, pos=self.pos)
+        self.assertIn(search.name, timings)
+        # without the box size the dense grid is not a candidate
+        self.assertNotIn('grid', select_backend(self.pos, self.radius)[1])
+
+    def test_verlet_list_rebuilds_on_displacement(self):
+        skin = 0.04
+        verlet = VerletList(CellList(self.radius + skin, 1.0), self.radius, skin)
+        pos = self.pos.copy()
+        self.assertSamePairs(verlet.pairs(pos), brute_force_pairs(pos, pos, self.radius))
+        pos[0] += [0.015, 0.0]  # below skin/2: cached list is reused
+        self.assertSamePairs(verlet.pairs(pos), brute_force_pairs(pos, pos, self.radius))
+        self.assertEqual(verlet.builds, 1)
+        pos[1] += [0.0, 0.03]   # above skin/2: rebuild
+        self.assertSamePairs(verlet.pairs(pos), brute_force_pairs(pos, pos, self.radius))
+        self.assertEqual(verlet.builds, 2)
+        self.assertEqual(verlet.stats()['calls'], 3)
+
+    def test_query_last_reuses_bins(self):
+        points = self.pos[:7] + 0.01
+        expected = brute_force_pairs(points, self.pos, self.radius)
+        for kind in BACKENDS:
+            search = make_neighbor_search(kind, self.radius, L=1.0)
+            search.pairs(self.pos)
+            self.assertSamePairs(search.query_last(points), expected)
+        # Through a Verlet list: bins of the last rebuild, distances from the current positions
+        skin = 0.04
+        search = HashedCellList(self.radius + skin)
+        verlet = VerletList(search, self.radius, skin)
+        pos = self.pos.copy()
+        verlet.pairs(pos)
+        pos[:50] += [0.015, -0.01]
+        verlet.pairs(pos)
+        binned = search._bin
+        search._bin = lambda cells: self.fail("query_last binned the particles again")
+        got = verlet.query_last(points, pos)
+        default = verlet.query_last(points)
+        search._bin = binned
+        self.assertSamePairs(got, brute_force_pairs(points, pos, self.radius))
+        self.assertSamePairs(default, got)
+        self.assertEqual(verlet.builds, 1)
+
+
+class TestKernels(unittest.TestCase):
+    def test_gradient_matches_finite_difference(self):
+        rng = np.random.default_rng(2)
+        rij = rng.uniform(-0.15, 0.15, size=(200, 2))
+        r = np.linalg.norm(rij, axis=1)
+        eps = 1e-7
+        for name in KERNELS:
+            kernel = get_kernel(name, 2, 0.08)
+            fd = np.stack([(kernel.w(np.linalg.norm(rij + eps * e, axis=1)) -
+                            kernel.w(np.linalg.norm(rij - eps * e, axis=1))) / (2 * eps)
+                           for e in np.eye(2)], axis=1)
+            np.testing.assert_allclose(kernel.grad(rij, r), fd, atol=1e-4 * kernel.sigma / kernel.h)
+
+    def test_lookup_table_close_to_exact(self):
+        r = np.linspace(0.0, 0.2, 1001)
+        rij = np.stack([r, np.zeros_like(r)], axis=1)
+        for name in KERNELS:
+            exact, table = get_kernel(name, 2, 0.08), get_kernel(name, 2, 0.08, table_size=4096)
+            np.testing.assert_allclose(table.w(r), exact.w(r), atol=5e-5 * exact.sigma)
+            np.testing.assert_allclose(table.grad(rij, r), exact.grad(rij, r), atol=1e-3 * exact.sigma / exact.h)
+            self.assertEqual(table.w(np.array([0.17]))[0], 0.0)  # outside the 2h support
+
+    def test_normalization(self):
+        from ThesisValidation.kernel_partition_check import main
+        self.assertEqual(main(), 0)
+
+    def test_cached_constants(self):
+        self.assertIs(get_kernel('wendland_c2', 3, 0.1), get_kernel('wendland_c2', 3, 0.1))
+        self.assertAlmostEqual(get_kernel('cubic', 2, 0.5).sigma, 10 / (7 * np.pi * 0.25))
+
+
+class TestPairOperators(unittest.TestCase):
+    def test_matches_per_particle_loops(self):
+        from sph_2d_example import Simulaatio
+        rng = np.random.default_rng(1)
+        pos = rng.uniform(0.0, 1.0, size=(150, 2))
+        vel = rng.normal(size=(150, 2))
+        h, m, k, rho0, mu = 0.08, 0.02, 2000.0, 2.0, 0.1
+        n = pos.shape[0]
+        # Reference: the original all-particle loops
+        rho_ref = np.array([np.sum(m * Simulaatio.W(pos - pos[a], h)) for a in range(n)])
+        p_ref = k * (rho_ref - rho0)
+        acc_ref = np.zeros_like(pos)
+        for a in range(n):
+            rij, vij = pos - pos[a], vel - vel[a]
+            acc_ref[a] -= np.sum(m * (p_ref[a]/rho_ref[a]**2 + p_ref/rho_ref**2)[:, None] * Simulaatio.gradW(rij, h), axis=0)
+            acc_ref[a] += mu * np.sum(m * (vij/rho_ref[:, None]) * Simulaatio.W(rij, h)[:, None], axis=0)
+
+        i, j = CellList(2 * h, 1.0).pairs(pos)
+        rij, r = pair_geometry(pos, i, j)
+        w, gradw = cubic_spline_w(r, h), cubic_spline_grad(rij, r, h)
+        rho = density(i, w, m, n)
+        p = k * (rho - rho0)
+        acc = pressure_acceleration(i, j, gradw, p, rho, m, n) + viscous_acceleration(i, j, w, vel, rho, m, mu, n)
+        np.testing.assert_allclose(rho, rho_ref, rtol=1e-12)
+        np.testing.assert_allclose(acc, acc_ref, rtol=1e-9, atol=1e-9 * np.abs(acc_ref).max())
+
+    def test_half_pairs_conserve_momentum(self):
+        rng = np.random.default_rng(4)
+        pos = rng.uniform(0.0, 1.0, size=(200, 2))
+        vel = rng.normal(size=(200, 2))
+        h, m, k, rho0, mu, n = 0.08, 0.02, 2000.0, 2.0, 0.1, 200
+        kernel = get_kernel('cubic', 2, h)
+        i, j = CellList(2 * h, 1.0).pairs(pos)
+        rij, r = pair_geometry(pos, i, j)
+        rho = density(i, kernel.w(r), m, n)
+        p = k * (rho - rho0)
+        acc_p = pressure_acceleration(i, j, kernel.grad(rij, r), p, rho, m, n)
+
+        hi, hj = half_pairs(i, j)
+        self.assertEqual(2 * hi.size + n, i.size)
+        hrij, hr = pair_geometry(pos, hi, hj)
+        w = kernel.w(hr)
+        rho_half = density_half(hi, hj, w, kernel.w(np.zeros(1))[0], m, n)
+        np.testing.assert_allclose(rho_half, rho, rtol=1e-12)
+        acc_ph = pressure_acceleration_half(hi, hj, kernel.grad(hrij, hr), p, rho, m, n)
+        np.testing.assert_allclose(acc_ph, acc_p, rtol=1e-9, atol=1e-9 * np.abs(acc_p).max())
+        acc_vh = viscous_acceleration_half(hi, hj, w, vel, rho, m, mu, n)
+        # internal forces cancel pairwise: total momentum change is rounding only
+        self.assertLess(np.abs(np.sum(acc_ph, axis=0)).max(), 1e-12 * np.abs(acc_ph).sum())
+        self.assertLess(np.abs(np.sum(acc_vh, axis=0)).max(), 1e-12 * np.abs(acc_vh).sum())
+
+
+class TestParticleSet(unittest.TestCase):
+    def test_add_remove_reorder(self):
+        ps = ParticleSet(capacity=2)
+        ps.add([[0.0, 0.0], [1.0, 0.0]], m=1.0)
+        ps.add([[2.0, 0.0]], v=[[0.0, 1.0]], m=2.0, phase=PHASE_DEM)
+        self.assertEqual(len(ps), 3)
+        self.assertGreaterEqual(ps.capacity, 3)
+        np.testing.assert_array_equal(ps.select(PHASE_DEM), [2])
+        buffer = ps._x
+        ps.remove([0])
+        np.testing.assert_array_equal(ps.x[:, 0], [1.0, 2.0])
+        np.testing.assert_array_equal(ps.m, [1.0, 2.0])
+        ps.reorder([1, 0])
+        np.testing.assert_array_equal(ps.x[:, 0], [2.0, 1.0])
+        np.testing.assert_array_equal(ps.phase, [PHASE_DEM, PHASE_FLUID])
+        self.assertIs(ps._x, buffer)  # remove/reorder work in place
+
+    def test_field_views_write_through(self):
+        ps = ParticleSet()
+        ps.add(np.zeros((4, 2)))
+        ps.x += 1.0
+        ps.v[1] = [3.0, 4.0]
+        ps.rho = np.arange(4.0)
+        np.testing.assert_array_equal(ps._x[:4], np.ones((4, 2)))
+        np.testing.assert_array_equal(ps._v[1], [3.0, 4.0])
+        np.testing.assert_array_equal(ps._rho[:4], np.arange(4.0))
+
+
+class TestStripDecomposition(unittest.TestCase):
+    def test_reallocate_to_shared_memory(self):
+        shared = SharedArrays()
+        ps = ParticleSet(capacity=4)
+        ps.add([[0.1, 0.2], [0.3, 0.4]], m=1.0, rho=2.0)
+        ps.reallocate(shared.zeros)
+        self.assertTrue(shared.owns(ps._x))
+        np.testing.assert_array_equal(ps.x, [[0.1, 0.2], [0.3, 0.4]])
+        np.testing.assert_array_equal(ps.rho, [2.0, 2.0])
+        ps.reallocate(None)
+        self.assertFalse(shared.owns(ps._x))
+        shared.close()
+        np.testing.assert_array_equal(ps.m, [1.0, 1.0])
+
+    def test_balance_on_particle_counts(self):
+        dd = StripDecomposition(4, h=0.05, m=1.0, k=1.0, rho0=1.0, mu=0.0)
+        x = np.random.default_rng(2).uniform(0.0, 1.0, 4000)
+        edges = dd.balance(x)
+        counts = np.histogram(x, edges)[0]
+        self.assertEqual(counts.sum(), 4000)
+        self.assertLessEqual(counts.max() - counts.min(), 1)
+        self.assertIs(dd.balance(x + 1e-4), edges)   # small motion keeps the strips
+        dd.balance(x**3)                             # fluid piles up at x = 0
+        self.assertEqual(dd.rebalances, 2)
+        self.assertLessEqual(np.ptp(np.histogram(x**3, dd.edges)[0]), 1)
+
+    def test_forces_match_serial_pass(self):
+        rng = np.random.default_rng(5)
+        n, h, m, k, rho0, mu = 600, 0.04, 0.02, 3.0, 2.0, 0.1
+        ps = ParticleSet(n)
+        ps.add(rng.uniform(0.0, 1.0, size=(n, 2)), v=rng.normal(size=(n, 2)), m=m)
+        kernel = get_kernel('cubic', 2, h)
+        i, j = CellList(2 * h, 1.0).pairs(ps.x)
+        rij, r = pair_geometry(ps.x, i, j)
+        w = kernel.w(r)
+        rho = density(i, w, m, n)
+        p = k * (rho - rho0)
+        acc = pressure_acceleration(i, j, kernel.grad(rij, r), p, rho, m, n)
+        acc += viscous_acceleration(i, j, w, ps.v, rho, m, mu, n)
+
+        dd = StripDecomposition(3, h, m, k, rho0, mu)
+        try:
+            acc_dd = dd.forces(ps)
+            np.testing.assert_array_equal(ps.rho, rho)
+            np.testing.assert_array_equal(ps.p, p)
+            np.testing.assert_array_equal(acc_dd, acc)
+        finally:
+            dd.close(ps)
+        self.assertIsNone(ps.allocator)
+        np.testing.assert_array_equal(ps.rho, rho)
+
+    def test_growth_releases_blocks_and_checks_message_order(self):
+        rng = np.random.default_rng(6)
+        h, m = 0.05, 0.02
+        ps = ParticleSet(200)
+        ps.add(rng.uniform(0.0, 1.0, size=(200, 2)), m=m)
+        dd = StripDecomposition(2, h, m, 1.0, 1.0, 0.1)
+        try:
+            dd.forces(ps)
+            ps.add(rng.uniform(0.0, 1.0, size=(300, 2)), m=m)   # grows the shared buffers
+            acc = dd.forces(ps)
+            self.assertEqual(acc.shape, (500, 2))
+            # Only the live particle buffers and the acceleration block remain
+            self.assertEqual(len(dd.shared._blocks), len(ps.buffers()) + 1)
+            # 'forces' without its 'density' pass is refused instead of reusing stale pairs
+            conn = dd._workers[0][0]
+            arrays = {name: dd.shared.describe(ps.buffers()[name]) for name in ('x', 'v', 'rho', 'p')}
+            arrays['acc'] = dd.shared.describe(dd._acc)
+            conn.send(('forces', arrays, len(ps), dd.edges[0], dd.edges[1]))
+            self.assertIsInstance(conn.recv(), RuntimeError)
+        finally:
+            dd.close(ps)
+
+
+class TestNumbaEngine(unittest.TestCase):
+    def make(self, engine, steps):
+        from sph_2d_example import Simulaatio
+        random.seed(5)
+        return Simulaatio(N=100, L=1.0, h=0.08, m=0.02, rho0=1000, k=2000, mu=0.1, G=np.array([0, -9.81]),
+                          dt=0.001, steps=steps, fill_frac=0.4, engine=engine)
+
+    @unittest.skipUnless(numba_engine.NUMBA_AVAILABLE, "Numba not installed")
+    def test_matches_numpy_engine(self):
+        ref, fast = self.make('numpy', 2), self.make('numba', 2)
+        self.assertEqual(fast.engine, 'numba')
+        r_ref, r_fast = ref.aja(), fast.aja()
+        np.testing.assert_allclose(fast.pos, ref.pos, rtol=1e-12, atol=1e-12)
+        np.testing.assert_allclose(fast.vel, ref.vel, rtol=1e-9, atol=1e-9 * np.abs(ref.vel).max())
+        np.testing.assert_allclose(fast.damperi.dem_vel, ref.damperi.dem_vel, rtol=1e-9, atol=1e-12)
+        np.testing.assert_allclose(r_fast['kin'], r_ref['kin'], rtol=1e-9)
+
+    def test_falls_back_without_numba(self):
+        available = numba_engine.NUMBA_AVAILABLE
+        numba_engine.NUMBA_AVAILABLE = False
+        try:
+            with self.assertWarns(UserWarning):
+                sim = self.make('numba', 1)
+        finally:
+            numba_engine.NUMBA_AVAILABLE = available
+        self.assertEqual(sim.engine, 'numpy')
+
+class Oscillator:
+    """Damped harmonic oscillator x'' = -x - c x' behind the sph.integrators interface."""
+
+    def __init__(self, c=0.0):
+        self.x, self.v, self.c = np.array([1.0]), np.array([0.0]), c
+
+    def acceleration(self):
+        return -self.x - self.c * self.v
+
+    def kick(self, acc, dt):
+        self.v += acc * dt
+
+    def drift(self, dt):
+        self.x += self.v * dt
+
+    def save(self):
+        return self.x.copy(), self.v.copy()
+
+    def restore(self, state):
+        self.x, self.v = state
+
+
+class TestIntegrators(unittest.TestCase):
+    def run_scheme(self, scheme, dt, t_end, c=0.0):
+        osc = Oscillator(c)
+        acc = None
+        for _ in range(int(round(t_end / dt))):
+            acc = integrators.step(scheme, osc, dt, acc)
+        return osc
+
+    def test_order_of_accuracy(self):
+        cases = (('euler', 1, 0.0), ('leapfrog', 2, 0.0), ('verlet', 2, 0.0), ('predictor_corrector', 2, 0.0),
+                 ('verlet', 2, 0.3), ('predictor_corrector', 2, 0.3))
+        for scheme, order, c in cases:
+            exact = self.run_scheme('predictor_corrector', 1e-4, 2.0, c).x[0]
+            e1 = abs(self.run_scheme(scheme, 0.02, 2.0, c).x[0] - exact)
+            e2 = abs(self.run_scheme(scheme, 0.01, 2.0, c).x[0] - exact)
+            self.assertAlmostEqual(np.log2(e1 / e2), order, delta=0.2, msg=scheme)
+
+    def test_symplectic_energy_bounded(self):
+        # 100 periods at dt = 0.2: leapfrog energy error stays O(dt^2), no secular drift
+        osc = self.run_scheme('leapfrog', 0.2, 200 * np.pi)
+        self.assertLess(abs(0.5 * (osc.x[0]**2 + osc.v[0]**2) - 0.5), 0.01)
+
+    def test_unknown_scheme(self):
+        with self.assertRaises(ValueError):
+            integrators.step('rk4', Oscillator(), 0.1)
+
+class TestTelemetryRecorder(unittest.TestCase):
+    def fill(self, rec, n):
+        for k in range(n):
+            rec.record(a=k, b=0.5 * k)
+        return rec.arrays()
+
+    def test_chunks_and_decimation(self):
+        rec = TelemetryRecorder({'a': np.int64, 'b': np.float32}, chunk_size=4, decimate={'b': 3})
+        out = self.fill(rec, 10)
+        np.testing.assert_array_equal(out['a'], np.arange(10))
+        np.testing.assert_array_equal(out['b'], 0.5 * np.arange(0, 10, 3))
+        self.assertEqual(out['b'].dtype, np.float32)
+        np.testing.assert_array_equal(rec.steps('b'), [0, 3, 6, 9])
+
+    def test_spill_to_disk(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            rec = TelemetryRecorder(('a', 'b'), chunk_size=4, spill_dir=tmp)
+            out = self.fill(rec, 10)
+            rec.close()
+            self.assertIsInstance(out['a'], np.memmap)
+            np.testing.assert_array_equal(out['b'], 0.5 * np.arange(10))
+            # one file per channel, no chunk files left behind
+            self.assertEqual(sorted(os.listdir(tmp)), ['a.npy', 'b.npy'])
+            self.assertEqual(os.path.getsize(os.path.join(tmp, 'a.npy')), 128 + 10 * 8)
+            del out
+
+    def test_fork_restored_recorder(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            run, branch = os.path.join(tmp, 'run'), os.path.join(tmp, 'branch')
+            rec = TelemetryRecorder(('a', 'b'), chunk_size=4, spill_dir=run)
+            for k in range(6):
+                rec.record(a=k, b=0.5 * k)
+            state = pickle.dumps(rec)
+            for k in range(6, 10):
+                rec.record(a=k, b=0.5 * k)
+            out = rec.arrays()
+            rec.close()
+            restored = pickle.loads(state)
+            self.assertTrue(restored.overwrites())
+            restored.fork(branch)
+            self.assertFalse(restored.overwrites())
+            for k in range(6, 8):
+                restored.record(a=-k, b=0.0)
+            forked = restored.arrays()
+            restored.close()
+            np.testing.assert_array_equal(out['a'], np.arange(10))
+            np.testing.assert_array_equal(forked['a'], [0, 1, 2, 3, 4, 5, -6, -7])
+            del out, forked
+
+class TestSnapshots(unittest.TestCase):
+    def frames(self, k, n=5):
+        return {'x': np.full((n, 2), k, dtype=float), 'rho': np.arange(n) + 10.0 * k}
+
+    def test_roundtrip(self):
+        for compress in (True, False):
+            with tempfile.TemporaryDirectory() as tmp:
+                writer = SnapshotWriter(tmp, 5, fields=('x', 'rho'), frames_per_chunk=3, compress=compress)
+                for k in range(7):
+                    writer.append(0.1 * k, **self.frames(k))
+                reader = SnapshotReader(tmp)
+                self.assertEqual(len(reader), 6)   # last partial chunk not written yet
+                writer.close()
+                self.assertEqual(len(reader), 7)
+                np.testing.assert_allclose(reader.times, 0.1 * np.arange(7))
+                np.testing.assert_array_equal(reader.field('x', 4), self.frames(4)['x'])
+                np.testing.assert_array_equal(reader.frame(6, particles=[1, 3])['rho'], [61.0, 63.0])
+                # appending after close() completes the partial chunk
+                writer.append(0.7, **self.frames(7))
+                writer.close()
+                np.testing.assert_array_equal(reader.field('rho', 7), self.frames(7)['rho'])
+                with self.assertRaises(IndexError):
+                    reader.field('x', 8)
+
+    def test_restore_and_fork(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            writer = SnapshotWriter(os.path.join(tmp, 'run'), 5, fields=('x', 'rho'), frames_per_chunk=2)
+            for k in range(3):
+                writer.append(0.1 * k, **self.frames(k))
+            state = pickle.dumps(writer)
+            for k in range(3, 6):
+                writer.append(0.1 * k, **self.frames(k))
+            writer.close()
+            # Loading the checkpoint twice leaves the files alone
+            branches = [pickle.loads(state), pickle.loads(state)]
+            self.assertEqual(len(SnapshotReader(os.path.join(tmp, 'run'))), 6)
+            for b, branch in enumerate(branches):
+                branch.fork(os.path.join(tmp, f'branch{b}'))
+                branch.append(0.3, **self.frames(10 + b))
+                branch.close()
+            for b in range(2):
+                reader = SnapshotReader(os.path.join(tmp, f'branch{b}'))
+                np.testing.assert_allclose(reader.times, [0.0, 0.1, 0.2, 0.3])
+                np.testing.assert_array_equal(reader.field('rho', 2), self.frames(2)['rho'])
+                np.testing.assert_array_equal(reader.field('rho', 3), self.frames(10 + b)['rho'])
+            self.assertEqual(len(SnapshotReader(os.path.join(tmp, 'run'))), 6)
+
+    def test_fields_from_config(self):
+        cfg = {'output': {'save_velocity': True, 'save_pressure': True, 'save_positions': False}}
+        self.assertEqual(snapshot_fields_from_config(cfg), ('v', 'rho', 'p'))
+
+if __name__ == "__main__":
+    unittest.main()